@@ -2,6 +2,18 @@ import streamlit as st
 from datetime import datetime
 import uuid
 import json
+import os
+import sys
+
+# the shared resource factories live one level up in Frontend/, the backend in Search_Engine/
+current_dir = os.path.dirname(os.path.abspath(__file__))
+frontend_dir = os.path.dirname(current_dir)
+sys.path.insert(0, frontend_dir)
+
+from resources import init_rag_resources
+from RAG import rag_pipeline
+
+collection_name = "reddit_post_comment"
 
 # =============================================================================
 # CHAT HISTORY MANAGEMENT SYSTEM
@@ -302,22 +314,12 @@ def render_main_chat(chat_manager):
         
         # Show thinking
         with st.spinner("🤔 Thinking..."):
-            import time
-            time.sleep(1)  # Simulate processing
-            
-            # Generate mock response
-            mock_response = f"""Based on Reddit discussions about "{user_input}", here's what I found:
-
-This is a mock response from your RAG system. In the real implementation, this would:
-
-1. 🔍 Search your vector database for relevant Reddit posts
-2. 📝 Send context to Llama 3 API  
-3. ✨ Generate this response based on Reddit discussions
-
-*This response was generated for chat: {current_chat['title']}*"""
+            response = rag_pipeline(user_input, collection_name)
+            if response is None:
+                response = "Sorry, I could not get an answer right now. Please try again."
         
         # Add assistant response
-        chat_manager.add_message_to_current_chat("assistant", mock_response)
+        chat_manager.add_message_to_current_chat("assistant", response)
         
         st.rerun()
 
@@ -336,6 +338,9 @@ def main():
         initial_sidebar_state="expanded"
     )
     
+    # Cached client, embedding models and LLM session, built once per server process
+    init_rag_resources()
+    
     # Initialize chat manager
     chat_manager = ChatManager()
     
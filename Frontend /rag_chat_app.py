@@ -12,6 +12,9 @@ search_engine_dir = os.path.join(parent_dir, 'Search_Engine')
 sys.path.insert(0, search_engine_dir)
 
 from RAG import search, build_prompt, lamma3_groq, rag_pipeline
+from resources import init_rag_resources
+from metrics import get_trace
+collection_name = "reddit_post_comment"
 
 st.set_page_config(
     page_title="Simple RAG Chat",
@@ -19,6 +22,9 @@ st.set_page_config(
     layout="wide"
 )
 
+# cached client, embedding models and LLM session, built once per server process
+init_rag_resources()
+
 # Title
 st.title("🤖 All About Reddit")
 st.write("Ask me questions about Reddit discussions!")
@@ -36,61 +42,95 @@ if "chat_messages" not in st.session_state:
 # Sidebar settings
 with st.sidebar:
     st.header("⚙️ Settings")
+
+    # filters run inside qdrant on the indexed payload fields
+    st.subheader("🔎 Filters")
+    subreddit_input = st.text_input("Subreddits (comma separated)", "")
+    min_upvotes = st.number_input("Minimum upvotes", min_value=0, value=0, step=1)
+    filters = {
+        "subreddits": [s.strip() for s in subreddit_input.split(",") if s.strip()] or None,
+        "min_upvotes": int(min_upvotes) if min_upvotes > 0 else None,
+    }
+    # cross-encoder rescoring of the top 50 hits, slower but better context
+    rerank = st.checkbox("Rerank results", value=False)
+    # skip near-identical comments of the same thread in the context
+    mmr = st.checkbox("Diversify results (MMR)", value=False)
     
+    # latency breakdown of the last answer, filled in after each response
+    st.subheader("⏱️ Last response")
+    latency_panel = st.empty()
+
     if st.button("🗑️ Clear Chat"):
         st.session_state.chat_messages = st.session_state.chat_messages[:1]  # Keep welcome message
         st.rerun()
 
+
+def render_latency_panel(trace):
+    if not trace:
+        latency_panel.caption("No response yet")
+        return
+    with latency_panel.container():
+        for stage_name, seconds in trace["stages"].items():
+            st.write(f"**{stage_name}**: {seconds * 1000:.0f} ms")
+        for key, value in trace["attributes"].items():
+            st.caption(f"{key}: {value:.3f}" if isinstance(value, float) else f"{key}: {value}")
+        for error in trace["errors"]:
+            st.error(error)
+
+
+render_latency_panel(st.session_state.get("last_trace"))
+
 # Chat display area
+# st.chat_message renders markdown natively, so history is drawn once per rerun
+# and new turns are appended below it instead of re-rendering raw HTML
 chat_container = st.container()
 
+
+def render_message(message):
+    role = message["role"]
+    timestamp = message["timestamp"].strftime("%H:%M")
+    avatar = "🧑" if role == "user" else "🤖"
+    with st.chat_message(role, avatar=avatar):
+        st.caption(timestamp)
+        st.markdown(message["content"])
+
+
 with chat_container:
     for message in st.session_state.chat_messages:
-        role = message["role"]
-        content = message["content"]
-        timestamp = message["timestamp"].strftime("%H:%M")
-        
-        if role == "user":
-            st.markdown(f"""
-            <div style="background-color: #DCF8C6; padding: 10px; border-radius: 10px; 
-                        margin: 10px 0; text-align: right;">
-                <strong>You ({timestamp}):</strong><br>{content}
-            </div>
-            """, unsafe_allow_html=True)
-        else:
-            st.markdown(f"""
-            <div style="background-color: #F1F1F1; padding: 10px; border-radius: 10px; 
-                        margin: 10px 0;">
-                <strong>🤖 Assistant ({timestamp}):</strong><br>{content}
-            </div>
-            """, unsafe_allow_html=True)
+        render_message(message)
 
 # User input
 user_input = st.chat_input("Ask me anything about Reddit discussions...")
 
 if user_input:
     # Add user message
-
-    st.session_state.chat_messages.append({
+    user_message = {
         "role": "user",
         "content": user_input,
         "timestamp": datetime.now()
-    })
-
-    try:
-        with st.spinner("🤔 Thinking..."):
-            result = rag_pipeline(user_input) 
-        
-        st.session_state.chat_messages.append({
-            "role": "assistant", 
-            "content": result,
-            "timestamp": datetime.now()
-        })
-    except Exception as e:
-        st.error(f"Error: {e}")
-    
-    st.rerun()
+    }
+    st.session_state.chat_messages.append(user_message)
 
-    
+    with chat_container:
+        render_message(user_message)
+
+        try:
+            with st.chat_message("assistant", avatar="🤖"):
+                st.caption(datetime.now().strftime("%H:%M"))
+                # tokens are drawn as they arrive, write_stream returns the full text at the end
+                result = st.write_stream(rag_pipeline(user_input, collection_name, stream=True, filters=filters, rerank=rerank, mmr=mmr))
 
+            st.session_state.last_trace = get_trace()
+            render_latency_panel(st.session_state.last_trace)
 
+            # a failed LLM call ends the stream without a token, don't save an empty answer
+            if not result:
+                st.error("Sorry, I could not get an answer right now. Please try again.")
+            else:
+                st.session_state.chat_messages.append({
+                    "role": "assistant", 
+                    "content": result,
+                    "timestamp": datetime.now()
+                })
+        except Exception as e:
+            st.error(f"Error: {e}")
@@ -0,0 +1,52 @@
+# Long-lived backend resources for the Streamlit apps.
+# Streamlit reruns the page script on every interaction, st.cache_resource keeps one
+# instance of each per server process so reruns don't rebuild connections or reload models.
+import streamlit as st 
+import os 
+import sys 
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+search_engine_dir = os.path.join(parent_dir, 'Search_Engine')
+if search_engine_dir not in sys.path:
+    sys.path.insert(0, search_engine_dir)
+
+from qdrant_client import QdrantClient
+from llm_client import GroqClient
+from metrics import start_metrics_server
+import RAG
+
+
+@st.cache_resource(show_spinner=False)
+def get_qdrant_client():
+    return QdrantClient(RAG.qdrant_url)
+
+
+@st.cache_resource(show_spinner="Loading embedding models...")
+def get_embedding_models():
+    models = {handle: RAG.get_embedding_model(handle) for handle in (RAG.model_handle, RAG.sparse_model_handle)}
+    # one dummy query so weights are downloaded/loaded before the first real question
+    RAG.warm_up(models.keys())
+    return models
+
+
+@st.cache_resource(show_spinner=False)
+def get_llm_client():
+    return GroqClient()
+
+
+@st.cache_resource(show_spinner=False)
+def get_metrics_server():
+    # Streamlit has no /metrics route, so Prometheus scrapes a side port when METRICS_PORT is set
+    port = os.getenv("METRICS_PORT")
+    return start_metrics_server(int(port)) if port else False
+
+
+def init_rag_resources():
+    """Call at the top of every app script, hands the cached resources to the RAG backend."""
+    get_metrics_server()
+    RAG.use_resources(
+        qdrant_client=get_qdrant_client(),
+        embedding_models=get_embedding_models(),
+        llm=get_llm_client()
+    )
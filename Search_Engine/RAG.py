@@ -1,47 +1,280 @@
 from qdrant_client import QdrantClient, models
+from fastembed import TextEmbedding, SparseTextEmbedding
+from embedding_cache import EmbeddingCache, normalize_query
+from answer_cache import SemanticAnswerCache, context_signature
+from llm_client import GroqClient
+from context_packer import pack_context, get_tokenizer
+from post_store import rehydrate
+from reranker import load_rerank_model, rerank_points, rerank_fields
+import reranker
+from mmr import mmr_points
+from metrics import stage, traced, start_trace, record_hits, record_attribute, register_cache_stats
 from datetime import datetime
+from contextlib import ExitStack
 import pandas as pd 
 import numpy as np 
 from tqdm import tqdm
+import threading
 import time
 import os 
-import requests 
 import argparse
+import json
 
 model_handle = "jinaai/jina-embeddings-v2-small-en"
-client = QdrantClient("http://localhost:6333")
+sparse_model_handle = "Qdrant/bm25"
+rerank_model_handle = os.getenv("RERANK_MODEL", reranker.rerank_model_handle)
+# candidates fetched for reranking and the seconds the cross-encoder may spend on them
+rerank_candidates = int(os.getenv("RERANK_CANDIDATES", "50"))
+rerank_budget = float(os.getenv("RERANK_BUDGET", "0.5"))
+# 1 = pure relevance, lower = more diverse results with search(mmr=True)
+mmr_lambda = float(os.getenv("MMR_LAMBDA", "0.5"))
+qdrant_url = os.getenv("QDRANT_URL", "http://localhost:6333")
+client = None  # created on first use, or injected with use_resources()
 collection_name = "reddit_post_comment"
 
-# do search 
-def search(query, collection_name, limit=5):
+# repeated questions skip the encoder, EMBED_CACHE_DB keeps the cache on disk across restarts
+query_cache = EmbeddingCache(
+    maxsize=int(os.getenv("EMBED_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("EMBED_CACHE_TTL", str(24 * 3600))),
+    db_path=os.getenv("EMBED_CACHE_DB")
+)
+_embedding_models = {}
+_embedding_models_lock = threading.Lock()  # serve.py and AsyncRAG embed from several threads
+
+
+def get_client():
+    global client
+    if client is None:
+        client = QdrantClient(qdrant_url)
+    return client
+
+
+def get_embedding_model(handle):
+    # under the lock so concurrent first queries load a model once instead of once per thread
+    with _embedding_models_lock:
+        if handle not in _embedding_models:
+            if handle == sparse_model_handle:
+                _embedding_models[handle] = SparseTextEmbedding(model_name=handle)
+            elif handle == rerank_model_handle:
+                _embedding_models[handle] = load_rerank_model(handle)
+            else:
+                _embedding_models[handle] = TextEmbedding(model_name=handle)
+        return _embedding_models[handle]
+
+
+@traced("embed_query")
+def embed_queries(queries, handle=model_handle, batch_size=256):
+    """Query vectors for many queries: cache hits are reused, all misses go through one batched encoder call."""
+    vectors = [query_cache.get(handle, q) for q in queries]
+    missing = [i for i, v in enumerate(vectors) if v is None]
+
+    if missing:
+        texts = [normalize_query(queries[i]) for i in missing]
+        embeddings = get_embedding_model(handle).query_embed(texts, batch_size=batch_size)
+        for i, embedding in zip(missing, embeddings):
+            # cached as float32 arrays, converted to lists only for the qdrant request
+            if handle == sparse_model_handle:
+                vectors[i] = {"indices": embedding.indices.astype(np.int32), "values": embedding.values.astype(np.float32)}
+            else:
+                vectors[i] = np.asarray(embedding, dtype=np.float32)
+            query_cache.put(handle, queries[i], vectors[i])
+
+    if handle == sparse_model_handle:
+        return [models.SparseVector(indices=v["indices"].tolist(), values=v["values"].tolist()) for v in vectors]
+    return [v.tolist() for v in vectors]
+
+
+def embed_query(query, handle=model_handle):
+    """Query vector for the given model, served from query_cache when possible."""
+    return embed_queries([query], handle)[0]
+
+
+def embedding_cache_stats():
+    return query_cache.stats()
+
+
+register_cache_stats("embedding_cache", embedding_cache_stats)
 
 
-    results = client.query_points(
+# payload fields search() returns by default, only these are transferred from qdrant
+# passage is only set on chunked collections (test.py --chunk_tokens), it is the text that matched
+result_fields = ['post_title', 'post_text', 'subreddit', 'post_url', 'post_upvotes', 'post_comment', 'passage']
+
+
+def build_filter(subreddits=None, authors=None, min_upvotes=None):
+    """Qdrant filter on the indexed payload fields, None when nothing is set."""
+    conditions = []
+    if subreddits:
+        conditions.append(models.FieldCondition(key="subreddit", match=models.MatchAny(any=list(subreddits))))
+    if authors:
+        conditions.append(models.FieldCondition(key="post_author", match=models.MatchAny(any=list(authors))))
+    if min_upvotes is not None:
+        conditions.append(models.FieldCondition(key="post_upvotes", range=models.Range(gte=min_upvotes)))
+    return models.Filter(must=conditions) if conditions else None
+
+
+def build_search_params(hnsw_ef=None, oversampling=None):
+    """hnsw_ef trades latency for recall; oversampling fetches limit*oversampling quantized candidates and rescores them."""
+    if hnsw_ef is None and oversampling is None:
+        return None
+    quantization = None
+    if oversampling is not None:
+        quantization = models.QuantizationSearchParams(rescore=True, oversampling=oversampling)
+    return models.SearchParams(hnsw_ef=hnsw_ef, quantization=quantization)
+
+
+# do search 
+@traced("search")
+def search_points(query, collection_name, limit=5, mode="dense", prefetch_limit=20, payload_fields=None, filters=None, hnsw_ef=None, oversampling=None, group_by_parent=False, group_size=1, rerank=False, min_score=None, mmr=False, mmr_candidates=None):
+    # mode="hybrid" fuses the dense and the bm25 sparse candidates with RRF,
+    # which helps keyword-heavy queries (usernames, product names)
+    # filters: dict of build_filter() arguments, e.g. {"subreddits": ["python"], "min_upvotes": 10}
+    # group_by_parent: for passage-chunked collections, return the best group_size passages of
+    # each of the top `limit` post+comment rows instead of several passages of the same row
+    # rerank: fetch rerank_candidates hits and keep the `limit` best by cross-encoder score
+    # min_score: drop hits scoring below it (similarity / RRF score, or cross-encoder score when reranking)
+    # mmr: fetch mmr_candidates (default 4*limit) hits with their vectors and pick `limit` relevant
+    # but mutually different ones (Maximal Marginal Relevance, mmr_lambda)
+    # post_id lets hits from a normalized collection (test.py --normalize_posts) be filled in from its post store,
+    # parent_id lets passages of a chunked collection get the post body from passage 0
+    with_payload = list(payload_fields or result_fields) + ['post_id', 'parent_id']
+    mmr_pool = max(mmr_candidates or 4 * limit, limit)
+    candidates = limit
+    if rerank:
+        with_payload += [field for field in rerank_fields if field not in with_payload]
+        candidates = max(candidates, rerank_candidates)
+    if mmr:
+        candidates = max(candidates, mmr_pool)
+    prefetch_limit = max(prefetch_limit, candidates)
+    query_filter = build_filter(**(filters or {}))
+    search_params = build_search_params(hnsw_ef, oversampling)
+    dense_vector = embed_query(query, model_handle) # precomputed (and cached) query vector
+
+    query_args = dict(
         collection_name=collection_name,
-        query=models.Document( 
-            text=query, # query must be text, qdrant will do the embedding for you 
-            model=model_handle 
-        ),
-        limit=limit, # top closest matches
-        with_payload=True #to get metadata in the results
+        query=dense_vector,
+        query_filter=query_filter, # applied inside qdrant using the payload indexes
+        search_params=search_params,
+        limit=candidates, # top closest matches
+        with_payload=with_payload, # only the metadata fields we actually use
+        with_vectors=mmr,
+        # with reranking the cutoff applies to the cross-encoder score instead
+        score_threshold=None if rerank else min_score
     )
+    if mode == "hybrid":
+        sparse_vector = embed_query(query, sparse_model_handle)
+        query_args.update(
+            prefetch=[
+                models.Prefetch(
+                    query=dense_vector,
+                    filter=query_filter,
+                    params=search_params,
+                    limit=prefetch_limit
+                ),
+                models.Prefetch(
+                    query=sparse_vector,
+                    using="bm25",
+                    filter=query_filter,
+                    limit=prefetch_limit
+                ),
+            ],
+            query=models.FusionQuery(fusion=models.Fusion.RRF),
+            search_params=None
+        )
+
+    with stage("qdrant"):
+        if group_by_parent:
+            groups = get_client().query_points_groups(group_by="parent_id", group_size=group_size, **query_args).groups
+            points = [hit for group in groups for hit in group.hits]
+        else:
+            points = get_client().query_points(**query_args).points
+        rehydrate(get_client(), collection_name, points)
+    if rerank:
+        with stage("rerank"):
+            record_attribute("rerank_candidates", len(points))
+            points = rerank_points(get_embedding_model(rerank_model_handle), query, points, top_k=mmr_pool if mmr else limit, budget=rerank_budget)
+        if min_score is not None:
+            points = [point for point in points if point.score >= min_score]
+    if mmr:
+        with stage("mmr"):
+            points = mmr_points(dense_vector, points, limit, lambda_mult=mmr_lambda)
+    record_hits(len(points))
+    return points
+
 
+def format_results(points, fields=None):
+    # id and score let callers threshold/dedupe, build_prompt packs the context by score
+    fields = fields or result_fields
     formatted_results = []
-    for point in results.points:  # Access points attribute
-        formatted_point = {
-            'post_title': point.payload['post_title'],
-            'post_text': point.payload['post_text'],
-            'subreddit': point.payload['subreddit'], 
-            'post_url': point.payload['post_url'],
-            'post_upvotes': point.payload['post_upvotes'],
-            'post_comment': point.payload['post_comment']
-        }
+    for point in points:
+        formatted_point = {field: point.payload.get(field) for field in fields}
+        formatted_point['id'] = str(point.id)
+        formatted_point['score'] = point.score
         formatted_results.append(formatted_point) 
 
     return formatted_results
 
+
+def search(query, collection_name, limit=5, mode="dense", prefetch_limit=20, payload_fields=None, filters=None, hnsw_ef=None, oversampling=None, group_by_parent=False, group_size=1, rerank=False, min_score=None, mmr=False, mmr_candidates=None):
+    points = search_points(query, collection_name, limit=limit, mode=mode, prefetch_limit=prefetch_limit, payload_fields=payload_fields, filters=filters, hnsw_ef=hnsw_ef, oversampling=oversampling, group_by_parent=group_by_parent, group_size=group_size, rerank=rerank, min_score=min_score, mmr=mmr, mmr_candidates=mmr_candidates)
+    return format_results(points, payload_fields)
+
+
+def search_batch(queries, collection_name, limit=5, mode="dense", prefetch_limit=20, payload_fields=None, filters=None, hnsw_ef=None, oversampling=None, min_score=None):
+    """search() for many queries in a single query_batch_points round-trip, one result list per query."""
+    with_payload = list(payload_fields or result_fields) + ['post_id', 'parent_id']
+    query_filter = build_filter(**(filters or {}))
+    search_params = build_search_params(hnsw_ef, oversampling)
+    dense_vectors = embed_queries(queries, model_handle)
+
+    if mode == "hybrid":
+        sparse_vectors = embed_queries(queries, sparse_model_handle)
+        requests_batch = [
+            models.QueryRequest(
+                prefetch=[
+                    models.Prefetch(query=dense, filter=query_filter, params=search_params, limit=prefetch_limit),
+                    models.Prefetch(query=sparse, using="bm25", filter=query_filter, limit=prefetch_limit),
+                ],
+                query=models.FusionQuery(fusion=models.Fusion.RRF),
+                filter=query_filter,
+                limit=limit,
+                score_threshold=min_score,
+                with_payload=with_payload
+            )
+            for dense, sparse in zip(dense_vectors, sparse_vectors)
+        ]
+    else:
+        requests_batch = [
+            models.QueryRequest(query=dense, filter=query_filter, params=search_params, limit=limit, score_threshold=min_score, with_payload=with_payload)
+            for dense in dense_vectors
+        ]
+
+    responses = get_client().query_batch_points(collection_name=collection_name, requests=requests_batch)
+    # one retrieve() for the posts of all queries
+    rehydrate(get_client(), collection_name, [point for response in responses for point in response.points])
+    return [format_results(response.points, payload_fields) for response in responses]
+
+
+def run_queries_file(queries_file, output, collection_name, limit=5, mode="dense", batch_size=256, filters=None, hnsw_ef=None, oversampling=None, min_score=None):
+    """Bulk retrieval: read one query per line, write {"query", "results"} jsonl."""
+    with open(queries_file) as f:
+        queries = [line.strip() for line in f if line.strip()]
+
+    with open(output, "w") as out:
+        for i in tqdm(range(0, len(queries), batch_size)):
+            batch = queries[i:i + batch_size]
+            for query, results in zip(batch, search_batch(batch, collection_name, limit=limit, mode=mode, filters=filters, hnsw_ef=hnsw_ef, oversampling=oversampling, min_score=min_score)):
+                out.write(json.dumps({"query": query, "results": results}) + "\n")
+    print(f"Wrote results for {len(queries)} queries to {output}")
+
+
+# token budget for the CONTEXT block; llama3-8b-8192 also has to fit the question and a 1024-token answer
+context_token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+
+
 # Build Prompt 
-def build_prompt(query, search_results):
+@traced("build_prompt")
+def build_prompt(query, search_results, token_budget=None):
     prompt_template = """
 You're a reddit summariser. Answer user's question based on the CONTEXT given to you.
 If you did not spot useful information, then answer based on your own knowledge. 
@@ -53,49 +286,116 @@ CONTEXT:
 {context}
 """.strip()
 
-    context = ""
-
-    for doc in search_results:
-        context = context + f"title: {doc['post_title']}\ncontent: {doc['post_text']}\ncomment: {doc['post_comment']}\nurl: {doc['post_url']}\nsubreddit: {doc['subreddit']}\npost_upvotes: {doc['post_upvotes']}\n\n"
+    # deduplicated, trimmed and ordered by score until the token budget is used up
+    context = pack_context(search_results, token_budget=token_budget or context_token_budget)
 
     prompt = prompt_template.format(question=query, context=context).strip()
     return prompt
 
 os.environ["API_KEY"] = "cannot tell"
 
+llm_client = None  # created on first use, or injected with use_resources()
+
+
+def get_llm_client():
+    global llm_client
+    if llm_client is None:
+        llm_client = GroqClient()
+    return llm_client
+
+
+@traced("llm")
 def lamma3_groq(prompt):
-    api_key = os.getenv('API_KEY') 
-    url = "https://api.groq.com/openai/v1/chat/completions"
+    return get_llm_client().complete(prompt)
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
 
+def lamma3_groq_stream(prompt):
+    """Yield the answer token by token as Groq streams it back."""
+    return get_llm_client().stream(prompt)
 
-    data = {
-        "model": "llama3-8b-8192",  # or "llama3-70b-8192" for larger model
-        "messages": [
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.7,
-        "max_tokens": 1024
-    }
 
-    response = requests.post(url, headers=headers, json=data)
+def use_resources(qdrant_client=None, embedding_models=None, llm=None):
+    """Share long-lived clients/models built elsewhere (e.g. st.cache_resource) instead of creating new ones."""
+    global client, llm_client
+    if qdrant_client is not None and qdrant_client is not client:
+        client = qdrant_client
+        answer_caches.clear()  # they hold a reference to the previous client
+    if embedding_models:
+        _embedding_models.update(embedding_models)
+    if llm is not None:
+        llm_client = llm
 
-    if response.status_code == 200:
-        return response.json()['choices'][0]['message']['content']
-    else:
-        print(f"Error: {response.status_code}, {response.text}")
-        return None
+
+def warm_up(handles=(model_handle, sparse_model_handle)):
+    """Load the embedding models and run one query through each so the first user query pays no load cost."""
+    for handle in handles:
+        list(get_embedding_model(handle).query_embed("warm up"))
+    # build_prompt's token counter, after the models so it can come from fastembed's cache
+    get_tokenizer()
+
+
+# semantic answer cache per knowledge base, ANSWER_CACHE_THRESHOLD is the cosine similarity needed for a hit
+answer_caches = {}
+
+
+def get_answer_cache(collection_name):
+    if collection_name not in answer_caches:
+        answer_caches[collection_name] = SemanticAnswerCache(
+            get_client(), collection_name,
+            threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+            ttl=float(os.getenv("ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+        )
+    return answer_caches[collection_name]
 
 
-def rag_pipeline(query,collection_name): 
-    search_results = search(query,collection_name)
-    prompt = build_prompt(query, search_results)
-    answer = lamma3_groq(prompt)
-    return answer 
+def rag_pipeline(query,collection_name, mode="dense", use_cache=True, stream=False, filters=None, hnsw_ef=None, oversampling=None, group_by_parent=False, rerank=False, min_score=None, mmr=False): 
+    # with stream=True a generator of answer chunks is returned instead of the full string
+    # every call starts a new metrics trace, metrics.get_trace() returns its stage breakdown
+    trace = start_trace()
+    # rag_pipeline includes generation in both modes: with stream=True the stage is handed to
+    # the generator and closes once the answer is drained
+    pipeline = ExitStack()
+    pipeline.enter_context(stage("rag_pipeline", trace=trace))
+    with pipeline:
+        # content_hash is only needed for the answer cache signature
+        points = search_points(query, collection_name, mode=mode, payload_fields=result_fields + ['content_hash'], filters=filters, hnsw_ef=hnsw_ef, oversampling=oversampling, group_by_parent=group_by_parent, rerank=rerank, min_score=min_score, mmr=mmr)
+
+        # retrieval still runs so a cached answer is only reused for the same context
+        answer_cache = query_vector = signature = None
+        if use_cache:
+            answer_cache = get_answer_cache(collection_name)
+            query_vector = embed_query(query, model_handle)
+            signature = context_signature(points)
+            with stage("answer_cache"):
+                cached_answer = answer_cache.lookup(query_vector, signature)
+            record_attribute("answer_cache_hit", cached_answer is not None)
+            if cached_answer is not None:
+                return iter([cached_answer]) if stream else cached_answer
+
+        prompt = build_prompt(query, format_results(points))
+        record_attribute("prompt_chars", len(prompt))
+
+        if stream:
+            return _stream_and_cache(query, prompt, answer_cache, query_vector, signature, trace, pipeline.pop_all())
+
+        answer = lamma3_groq(prompt)
+        if answer_cache is not None and answer is not None:
+            answer_cache.store(query, query_vector, signature, answer)
+        return answer 
+
+
+def _stream_and_cache(query, prompt, answer_cache, query_vector, signature, trace=None, pipeline=None):
+    chunks = []
+    start = time.perf_counter()
+    with pipeline or ExitStack():
+        with stage("llm", trace=trace):
+            for chunk in lamma3_groq_stream(prompt):
+                if not chunks:
+                    record_attribute("time_to_first_token", time.perf_counter() - start, trace)
+                chunks.append(chunk)
+                yield chunk
+        if answer_cache is not None and chunks:
+            answer_cache.store(query, query_vector, signature, "".join(chunks))
 
 
 
@@ -103,6 +403,30 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--query", type=str, help="Question")
     parser.add_argument("--collection_name", type=str, default="reddit_post_comment", help="Knowledge Base")
+    parser.add_argument("--mode", type=str, default="dense", choices=["dense", "hybrid"], help="dense only, or dense + bm25 fused with RRF")
+    parser.add_argument("--no_cache", action="store_true", help="Always call the LLM, skipping the semantic answer cache")
+    parser.add_argument("--stream", action="store_true", help="Print the answer as it is generated")
+    parser.add_argument("--queries_file", "--queries-file", dest="queries_file", type=str, default=None, help="Bulk retrieval: one query per line, results written as jsonl")
+    parser.add_argument("--output", type=str, default="search_results.jsonl", help="Output file for --queries_file")
+    parser.add_argument("--limit", type=int, default=5, help="Results per query for --queries_file")
+    parser.add_argument("--subreddit", type=str, nargs="+", default=None, help="Only search these subreddits")
+    parser.add_argument("--author", type=str, nargs="+", default=None, help="Only search posts by these authors")
+    parser.add_argument("--min_upvotes", type=int, default=None, help="Only search posts with at least this many upvotes")
+    parser.add_argument("--hnsw_ef", type=int, default=None, help="Search-time HNSW candidate list, higher = better recall, slower")
+    parser.add_argument("--oversampling", type=float, default=None, help="Quantized collections: fetch limit*oversampling candidates and rescore with original vectors")
+    parser.add_argument("--rerank", action="store_true", help="Rescore the top RERANK_CANDIDATES hits with a local cross-encoder (RERANK_BUDGET seconds max)")
+    parser.add_argument("--min_score", type=float, default=None, help="Drop hits scoring below this (cosine similarity, RRF score in hybrid mode, cross-encoder score with --rerank)")
+    parser.add_argument("--mmr", action="store_true", help="Diversify the results with Maximal Marginal Relevance (MMR_LAMBDA, default 0.5)")
+    parser.add_argument("--group_by_parent", action="store_true", help="Passage-chunked collections: one hit per post+comment row")
     args = parser.parse_args()
-    result = rag_pipeline(args.query,args.collection_name)
-    print(result)
\ No newline at end of file
+    search_kwargs = {"hnsw_ef": args.hnsw_ef, "oversampling": args.oversampling, "min_score": args.min_score}
+    filters = {"subreddits": args.subreddit, "authors": args.author, "min_upvotes": args.min_upvotes}
+    if args.queries_file:
+        run_queries_file(args.queries_file, args.output, args.collection_name, limit=args.limit, mode=args.mode, filters=filters, **search_kwargs)
+    elif args.stream:
+        for chunk in rag_pipeline(args.query,args.collection_name, mode=args.mode, use_cache=not args.no_cache, stream=True, filters=filters, group_by_parent=args.group_by_parent, rerank=args.rerank, mmr=args.mmr, **search_kwargs):
+            print(chunk, end="", flush=True)
+        print()
+    else:
+        result = rag_pipeline(args.query,args.collection_name, mode=args.mode, use_cache=not args.no_cache, filters=filters, group_by_parent=args.group_by_parent, rerank=args.rerank, mmr=args.mmr, **search_kwargs)
+        print(result)
\ No newline at end of file
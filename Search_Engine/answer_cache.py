@@ -0,0 +1,145 @@
+from qdrant_client import models
+import hashlib
+import uuid
+import time
+
+
+def answer_cache_name(collection_name):
+    return f"{collection_name}_answer_cache"
+
+
+def context_signature(points):
+    """Hash of the retrieved point ids and their content_hash, so edited or different context misses the cache."""
+    parts = sorted(f"{point.id}:{(point.payload or {}).get('content_hash', '')}" for point in points)
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+
+class SemanticAnswerCache:
+    """
+    Stores (query embedding, retrieved context signature, answer) in a dedicated qdrant collection.
+
+    A new query reuses a cached answer when its embedding is within `threshold` cosine
+    similarity of a cached query, the entry is younger than `ttl` seconds and the
+    retrieved context is the same set of points.
+
+    The cache is best effort: qdrant errors during lookup/store are logged and treated as
+    a miss, they never cost the caller its answer. A failed call forgets that the collection
+    exists, so a cache dropped by invalidate() in another process is recreated by the next store.
+    Expired entries are deleted at most once per `prune_every` seconds.
+    """
+
+    def __init__(self, client, collection_name, threshold=0.95, ttl=7 * 24 * 3600, prune_every=3600):
+        self.client = client
+        self.collection_name = collection_name
+        self.cache_name = answer_cache_name(collection_name)
+        self.threshold = threshold
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self.ready = False
+        self.checked_at = None  # last time the collection was found missing
+        self.pruned_at = None
+
+    def _exists(self, recheck_after=60.0):
+        """collection_exists(), asked at most once per recheck_after seconds while the collection is missing."""
+        if self.ready:
+            return True
+        if self.checked_at is not None and time.time() - self.checked_at < recheck_after:
+            return False
+        self.ready = self.client.collection_exists(self.cache_name)
+        self.checked_at = None if self.ready else time.time()
+        return self.ready
+
+    def _ensure_collection(self, dim):
+        if self.ready:
+            return
+        if not self.client.collection_exists(self.cache_name):
+            try:
+                self.client.create_collection(
+                    collection_name=self.cache_name,
+                    vectors_config=models.VectorParams(size=dim, distance=models.Distance.COSINE)
+                )
+            except Exception:
+                # another request or worker created it between the check and the create
+                if not self.client.collection_exists(self.cache_name):
+                    raise
+            self.client.create_payload_index(
+                collection_name=self.cache_name,
+                field_name="created_at",
+                field_schema=models.PayloadSchemaType.FLOAT
+            )
+        self.ready = True
+
+    def lookup(self, query_vector, signature):
+        try:
+            return self._lookup(query_vector, signature)
+        except Exception as e:
+            print(f"Answer cache lookup failed: {e}")
+            self._reset()
+            return None
+
+    def _lookup(self, query_vector, signature):
+        if not self._exists():
+            return None
+        results = self.client.query_points(
+            collection_name=self.cache_name,
+            query=query_vector,
+            query_filter=models.Filter(must=[
+                models.FieldCondition(key="context_signature", match=models.MatchValue(value=signature)),
+                models.FieldCondition(key="created_at", range=models.Range(gte=time.time() - self.ttl)),
+            ]),
+            score_threshold=self.threshold,
+            limit=1,
+            with_payload=["answer"]
+        )
+        if results.points:
+            return results.points[0].payload["answer"]
+        return None
+
+    def store(self, query, query_vector, signature, answer):
+        try:
+            self._store(query, query_vector, signature, answer)
+        except Exception as e:
+            print(f"Answer cache write failed: {e}")
+            self._reset()
+
+    def _store(self, query, query_vector, signature, answer):
+        self._ensure_collection(len(query_vector))
+        self.client.upsert(
+            collection_name=self.cache_name,
+            points=[models.PointStruct(
+                id=str(uuid.uuid4()),
+                vector=query_vector,
+                payload={
+                    "query": query,
+                    "answer": answer,
+                    "context_signature": signature,
+                    "created_at": time.time(),
+                }
+            )]
+        )
+        self._prune()
+
+    def _prune(self):
+        """Delete the entries older than ttl; lookups already skip them, this keeps the collection from growing."""
+        now = time.time()
+        if self.pruned_at is not None and now - self.pruned_at < self.prune_every:
+            return
+        self.pruned_at = now
+        self.client.delete(
+            collection_name=self.cache_name,
+            points_selector=models.FilterSelector(filter=models.Filter(must=[
+                models.FieldCondition(key="created_at", range=models.Range(lt=now - self.ttl)),
+            ])),
+            wait=False
+        )
+
+    def _reset(self):
+        # the collection may have been dropped (invalidate() from another process): check again next time
+        self.ready = False
+        self.checked_at = None
+
+    def invalidate(self):
+        """Drop every cached answer, called after the underlying collection is re-indexed."""
+        if self.client.collection_exists(self.cache_name):
+            self.client.delete_collection(self.cache_name)
+        self._reset()
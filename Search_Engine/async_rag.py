@@ -0,0 +1,126 @@
+from qdrant_client import AsyncQdrantClient, models
+from llm_client import AsyncGroqClient
+from RAG import (
+    build_prompt, build_filter, embed_query, format_results, warm_up,
+    model_handle, sparse_model_handle, qdrant_url, result_fields
+)
+from post_store import post_store_name, post_fields, missing_post_ids, merge_posts, missing_parent_ids, merge_parents
+import asyncio
+import argparse
+import json
+
+
+class AsyncRAG:
+    """
+    asyncio variant of the RAG.py pipeline.
+
+    Retrieval goes through AsyncQdrantClient and generation through AsyncGroqClient, so one
+    process can keep many questions in flight. Query embedding is CPU work and runs in a
+    worker thread, sharing the query embedding cache with the sync pipeline.
+    """
+
+    def __init__(self, url=qdrant_url, llm=None, max_concurrency=8):
+        self.client = AsyncQdrantClient(url)
+        self.llm = llm or AsyncGroqClient()
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.warmed_up = False
+
+    async def search_points(self, query, collection_name, limit=5, mode="dense", prefetch_limit=20, payload_fields=None, filters=None):
+        with_payload = list(payload_fields or result_fields) + ['post_id', 'parent_id']
+        query_filter = build_filter(**(filters or {}))
+        dense_vector = await asyncio.to_thread(embed_query, query, model_handle)
+
+        if mode == "hybrid":
+            sparse_vector = await asyncio.to_thread(embed_query, query, sparse_model_handle)
+            results = await self.client.query_points(
+                collection_name=collection_name,
+                prefetch=[
+                    models.Prefetch(query=dense_vector, filter=query_filter, limit=prefetch_limit),
+                    models.Prefetch(query=sparse_vector, using="bm25", filter=query_filter, limit=prefetch_limit),
+                ],
+                query=models.FusionQuery(fusion=models.Fusion.RRF),
+                query_filter=query_filter,
+                limit=limit,
+                with_payload=with_payload
+            )
+        else:
+            results = await self.client.query_points(
+                collection_name=collection_name,
+                query=dense_vector,
+                query_filter=query_filter,
+                limit=limit,
+                with_payload=with_payload
+            )
+        return await self.rehydrate(collection_name, results.points)
+
+    async def rehydrate(self, collection_name, points):
+        """Async post_store.rehydrate: post fields from the post store, post_text of passages from passage 0."""
+        payloads = [point.payload for point in points if point.payload is not None]
+        post_ids = missing_post_ids(payloads)
+        if post_ids:
+            records = await self.client.retrieve(collection_name=post_store_name(collection_name), ids=post_ids, with_payload=post_fields, with_vectors=False)
+            merge_posts(payloads, records)
+        parent_ids = missing_parent_ids(payloads)
+        if parent_ids:
+            records = await self.client.retrieve(collection_name=collection_name, ids=parent_ids, with_payload=["post_text"], with_vectors=False)
+            merge_parents(payloads, records)
+        return points
+
+    async def search(self, query, collection_name, limit=5, mode="dense", payload_fields=None, filters=None):
+        points = await self.search_points(query, collection_name, limit=limit, mode=mode, payload_fields=payload_fields, filters=filters)
+        return format_results(points, payload_fields)
+
+    async def rag_pipeline(self, query, collection_name, mode="dense", filters=None):
+        search_results = await self.search(query, collection_name, mode=mode, filters=filters)
+        # token counting is CPU work too, keep it off the event loop
+        prompt = await asyncio.to_thread(build_prompt, query, search_results)
+        return await self.llm.complete(prompt)
+
+    async def _bounded_pipeline(self, query, collection_name, mode, filters):
+        async with self.semaphore:
+            try:
+                return await self.rag_pipeline(query, collection_name, mode=mode, filters=filters)
+            except Exception as e:
+                # one failing question must not sink the rest of the batch
+                print(f"Error answering {query!r}: {e!r}")
+                return None
+
+    async def answer_batch(self, queries, collection_name, mode="dense", filters=None):
+        """Answer many questions concurrently, at most max_concurrency at a time. Results keep input order, None for failures."""
+        if not self.warmed_up:
+            # load the models and tokenizer once before the first batch fans out
+            await asyncio.to_thread(warm_up)
+            self.warmed_up = True
+        return await asyncio.gather(*(self._bounded_pipeline(q, collection_name, mode, filters) for q in queries))
+
+    async def close(self):
+        await self.client.close()
+        await self.llm.close()
+
+
+async def main(args):
+    with open(args.queries_file) as f:
+        queries = [line.strip() for line in f if line.strip()]
+
+    rag = AsyncRAG(max_concurrency=args.concurrency)
+    try:
+        answers = await rag.answer_batch(queries, args.collection_name, mode=args.mode)
+    finally:
+        await rag.close()
+
+    with open(args.output, "w") as f:
+        for query, answer in zip(queries, answers):
+            f.write(json.dumps({"query": query, "answer": answer}) + "\n")
+    failed = sum(answer is None for answer in answers)
+    print(f"Wrote {len(answers)} answers to {args.output} ({failed} failed)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries_file", type=str, required=True, help="One question per line")
+    parser.add_argument("--output", type=str, default="answers.jsonl", help="Where to write the answers (jsonl)")
+    parser.add_argument("--collection_name", type=str, default="reddit_post_comment", help="Knowledge Base")
+    parser.add_argument("--mode", type=str, default="dense", choices=["dense", "hybrid"], help="dense only, or dense + bm25 fused with RRF")
+    parser.add_argument("--concurrency", type=int, default=8, help="Questions in flight at once")
+    args = parser.parse_args()
+    asyncio.run(main(args))
@@ -0,0 +1,268 @@
+from qdrant_client import QdrantClient
+import pandas as pd
+import numpy as np
+import resource
+import sys
+import threading
+import time
+import argparse
+import json
+import os
+
+from test import create_collection, iter_point_batches, load_embedding_model, load_sparse_model
+import test
+from upload_engine import parallel_upsert
+from near_dedup import NearDuplicateFilter
+from post_store import PostStore
+
+subreddits = ["python", "datascience", "MachineLearning", "learnprogramming", "AskReddit", "technology", "gaming", "personalfinance"]
+vocab = np.array((
+    "the a to and of is in it you that for this on with was have are be but not my just like so "
+    "what can if do at or all about they there would one get from when more how use any think your "
+    "model data python code error install version learn job work money game play people time year"
+).split())
+
+
+def random_text(rng, n_rows, min_words, max_words):
+    lengths = rng.integers(min_words, max_words + 1, size=n_rows)
+    words = rng.choice(vocab, size=int(lengths.sum()))
+    splits = np.split(words, np.cumsum(lengths)[:-1])
+    return [" ".join(w) for w in splits]
+
+
+def write_synthetic_csv(path, n_rows, seed=42, chunk_rows=100000):
+    """
+    Reddit-shaped csv (same columns as reddit_posts_and_comments.csv), written in chunks.
+
+    Posts are drawn once and every comment row repeats its post's fields, as in the real
+    export, so the post store and content hashes see the same post on each of its ~10 rows.
+    """
+    rng = np.random.default_rng(seed)
+    n_posts = max(1, n_rows // 10)  # ~10 comments per post
+    post_text = pd.Series(random_text(rng, n_posts, 0, 200), dtype=object)
+    post_text[rng.random(n_posts) < 0.2] = None  # link posts have no body
+    post_subreddit = rng.choice(subreddits, size=n_posts)
+    posts = pd.DataFrame({
+        "subreddit": post_subreddit,
+        "post_title": random_text(rng, n_posts, 5, 15),
+        "post_text": post_text,
+        "post_author": [f"user_{i}" for i in rng.integers(0, n_posts, size=n_posts)],
+        "post_url": [f"https://www.reddit.com/r/{sub}/comments/{i}" for i, sub in enumerate(post_subreddit)],
+        "post_upvotes": rng.integers(0, 5000, size=n_posts),
+        "post_downvotes": rng.integers(0, 500, size=n_posts),
+    })
+    written = 0
+    while written < n_rows:
+        n = min(chunk_rows, n_rows - written)
+        chunk = posts.iloc[rng.integers(0, n_posts, size=n)].reset_index(drop=True)
+        chunk["comment_text"] = random_text(rng, n, 3, 80)
+        chunk.to_csv(path, mode="a" if written else "w", header=not written, index=False)
+        written += n
+    return path
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and its finished children (embedding workers)."""
+    scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is bytes on macOS, KiB on Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return own / 2**20, children / 2**20
+
+
+class TimedModel:
+    """Wraps an embedding model so the time spent in embed() is added to seconds[stage]."""
+
+    def __init__(self, model, seconds, stage):
+        self.model = model
+        self.seconds = seconds
+        self.stage = stage
+
+    def embed(self, texts, **kwargs):
+        start = time.perf_counter()
+        embeddings = list(self.model.embed(texts, **kwargs))
+        self.seconds[self.stage] += time.perf_counter() - start
+        return embeddings
+
+
+def time_stage(owner, name, seconds, stage):
+    """Replace owner.name (a module function or bound method) by a wrapper adding its run time to seconds[stage]."""
+    func = getattr(owner, name)
+
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            seconds[stage] += time.perf_counter() - start
+    setattr(owner, name, timed)
+
+
+class RandomEmbedding:
+    """Stand-in dense model for --random_vectors."""
+
+    def __init__(self, dim, seed=42):
+        self.dim = dim
+        self.rng = np.random.default_rng(seed)
+
+    def embed(self, texts, **kwargs):
+        return list(self.rng.standard_normal((len(texts), self.dim), dtype=np.float32))
+
+
+class TimedClient:
+    """Qdrant client proxy summing the time upload threads spend in upsert()."""
+
+    def __init__(self, client, seconds):
+        self.client = client
+        self.seconds = seconds
+        self.lock = threading.Lock()
+
+    def upsert(self, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.client.upsert(**kwargs)
+        finally:
+            with self.lock:
+                self.seconds["upsert_threads"] += time.perf_counter() - start
+
+
+def timed_batches(point_batches, seconds, counts):
+    """Time the producer side as a whole: everything iter_point_batches does for one batch."""
+    while True:
+        start = time.perf_counter()
+        points = next(point_batches, None)
+        seconds["produce"] += time.perf_counter() - start
+        if points is None:
+            return
+        counts["points"] += len(points)
+        yield points
+
+
+def main(args):
+    csv_path = args.csv_path
+    if csv_path is None:
+        csv_path = f"synthetic_reddit_{args.rows}.csv"
+        if not os.path.exists(csv_path):
+            print(f"Writing {args.rows} synthetic rows to {csv_path}")
+            write_synthetic_csv(csv_path, args.rows, seed=args.seed)
+
+    in_process = args.url == ":memory:"
+    if in_process:
+        print("Note: with --url :memory: the collection lives in this process, peak RSS includes it. "
+              "Point --url at a qdrant server to measure the pipeline's own memory.")
+    client = QdrantClient(":memory:") if in_process else QdrantClient(args.url)
+    if client.collection_exists(args.collection_name):
+        client.delete_collection(args.collection_name)
+    create_collection(client, args.collection_name, args.dim)
+
+    # the in-process client is not thread-safe, concurrent upserts only make sense against a server
+    upload_workers = 1 if in_process else args.upload_workers
+    max_in_flight = 1 if in_process else args.max_in_flight
+
+    # same stages as test.py: the real iter_point_batches and parallel_upsert, with timers around them
+    seconds = {"produce": 0.0, "preprocess": 0.0, "dedup": 0.0, "chunk_passages": 0.0, "embed_dense": 0.0, "embed_bm25": 0.0, "create_points": 0.0, "upsert_threads": 0.0}
+    counts = {"points": 0}
+    dense_model = RandomEmbedding(args.dim, seed=args.seed) if args.random_vectors else load_embedding_model(args.model_handle)
+    sparse_model = None if args.no_bm25 else TimedModel(load_sparse_model(args.sparse_model_handle), seconds, "embed_bm25")
+    post_store = None
+    if args.normalize_posts:
+        post_store = PostStore(client, args.collection_name, manifest_path=args.failed_manifest)
+        post_store.create(args.dim)
+    dedup = NearDuplicateFilter(threshold=args.dedup_threshold) if args.dedup_threshold else None
+    if dedup is not None:
+        time_stage(dedup, "keep_mask", seconds, "dedup")
+    # iter_point_batches looks these up in test's module namespace on every chunk
+    time_stage(test, "data_preprocessing", seconds, "preprocess")
+    time_stage(test, "prepare_chunk", seconds, "preprocess")
+    time_stage(test, "chunk_passages", seconds, "chunk_passages")
+    time_stage(test, "create_points", seconds, "create_points")
+
+    point_batches = iter_point_batches(
+        csv_path, TimedModel(dense_model, seconds, "embed_dense"),
+        chunksize=args.chunksize,
+        embed_batch_size=args.embed_batch_size,
+        embed_parallel=args.embed_parallel,
+        sparse_model=sparse_model,
+        chunk_tokens=args.chunk_tokens,
+        chunk_overlap=args.chunk_overlap,
+        post_store=post_store,
+        dedup=dedup,
+        model_handle=args.model_handle,
+    )
+
+    wall_start = time.perf_counter()
+    stats = parallel_upsert(
+        TimedClient(client, seconds), timed_batches(point_batches, seconds, counts), args.collection_name,
+        workers=upload_workers, max_in_flight=max_in_flight, manifest_path=args.failed_manifest
+    )
+    wall = time.perf_counter() - wall_start
+    rss_self, rss_children = peak_rss_mb()
+
+    # produce includes every timed producer stage; what is left is mostly pd.read_csv
+    producer_stages = ["preprocess", "dedup", "chunk_passages", "embed_dense", "embed_bm25", "create_points"]
+    stages = {
+        "read_csv+other": seconds["produce"] - sum(seconds[stage] for stage in producer_stages),
+        **{stage: seconds[stage] for stage in producer_stages},
+        "upsert_threads": seconds["upsert_threads"],
+        # producer blocked on backpressure plus draining the last uploads
+        "upload_wait": wall - seconds["produce"],
+    }
+    report = {
+        "csv_path": csv_path,
+        "points": counts["points"],
+        "successful_uploads": stats["successful_uploads"],
+        "failed_batches": stats["failed_batches"],
+        "chunksize": args.chunksize,
+        "embed_batch_size": args.embed_batch_size,
+        "embed_parallel": args.embed_parallel,
+        "upload_workers": upload_workers,
+        "random_vectors": args.random_vectors,
+        "bm25": not args.no_bm25,
+        "stages": {
+            stage: {"seconds": value, "points_per_sec": counts["points"] / value if value > 0 else None}
+            for stage, value in stages.items()
+        },
+        "wall_clock_seconds": wall,
+        "points_per_sec": counts["points"] / wall if wall else None,
+        "peak_rss_mb": rss_self,
+        "peak_rss_children_mb": rss_children,
+        "rss_includes_collection": in_process,
+    }
+
+    print(f"\n{'stage':<16}{'seconds':>10}{'points/sec':>14}")
+    for stage, values in report["stages"].items():
+        rate = f"{values['points_per_sec']:.0f}" if values["points_per_sec"] else "-"
+        print(f"{stage:<16}{values['seconds']:>10.1f}{rate:>14}")
+    print(f"Total wall clock: {wall:.1f}s for {counts['points']} points ({report['points_per_sec']:.0f} points/sec)")
+    print(f"Peak RSS: {rss_self:.0f} MB (embedding workers: {rss_children:.0f} MB)" + (" - includes the in-process collection" if in_process else ""))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000, help="Synthetic rows to generate (10k-5M)")
+    parser.add_argument("--csv_path", type=str, default=None, help="Benchmark an existing csv instead of synthetic data")
+    parser.add_argument("--url", type=str, default=":memory:", help="Qdrant url, or :memory: for the in-process client (single upload worker, RSS includes the collection)")
+    parser.add_argument("--collection_name", type=str, default="bench_ingest", help="Scratch collection, dropped first")
+    parser.add_argument("--model_handle", type=str, default="jinaai/jina-embeddings-v2-small-en", help="embedding model")
+    parser.add_argument("--dim", type=int, default=512, help="Embedding dimension (default=512)")
+    parser.add_argument("--random_vectors", action="store_true", help="Skip the dense model and use random vectors, to time the other stages at large row counts")
+    parser.add_argument("--sparse_model_handle", type=str, default="Qdrant/bm25", help="sparse model for the bm25 vector")
+    parser.add_argument("--no_bm25", action="store_true", help="Skip the bm25 sparse encoding (test.py runs it by default)")
+    parser.add_argument("--chunk_tokens", type=int, default=None, help="Benchmark passage chunking (see test.py)")
+    parser.add_argument("--chunk_overlap", type=int, default=32, help="Tokens shared by consecutive passages")
+    parser.add_argument("--dedup_threshold", type=float, default=None, help="Benchmark the MinHash near-duplicate filter")
+    parser.add_argument("--normalize_posts", action="store_true", help="Benchmark the normalized post store layout")
+    parser.add_argument("--chunksize", type=int, default=50000, help="Rows read from the csv per chunk")
+    parser.add_argument("--embed_batch_size", type=int, default=256, help="Texts per embedding batch")
+    parser.add_argument("--embed_parallel", type=int, default=None, help="Embedding worker processes (0 = all cores, default: single process)")
+    parser.add_argument("--upload_workers", type=int, default=4, help="Concurrent upsert threads")
+    parser.add_argument("--max_in_flight", type=int, default=8, help="Pending upsert batches before the reader blocks")
+    parser.add_argument("--failed_manifest", type=str, default="bench_failed_batches.jsonl", help="Where failed batches are recorded")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=str, default=None, help="Also write the report as json")
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,144 @@
+from qdrant_client import QdrantClient
+import pandas as pd
+import numpy as np
+from tqdm import tqdm
+import time
+import argparse
+import json
+
+from test import (
+    data_preprocessing, prepare_chunk, create_collection, create_points,
+    load_embedding_model, load_sparse_model, embed_texts, embed_sparse
+)
+import RAG
+
+
+def load_sample(csv_path, sample_size, seed=42, chunksize=50000):
+    """Sample of prepared rows, read in chunks and sub-sampled per chunk so large dumps don't have to fit in memory."""
+    parts = []
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        prepared, _ = prepare_chunk(data_preprocessing(chunk))
+        if len(prepared) > sample_size:
+            prepared = prepared.sample(n=sample_size, random_state=seed)
+        parts.append(prepared)
+    sample = pd.concat(parts, ignore_index=True)
+    sample = sample.drop_duplicates("point_id")
+    if len(sample) > sample_size:
+        sample = sample.sample(n=sample_size, random_state=seed)
+    return sample.reset_index(drop=True)
+
+
+def build_collection(client, collection_name, sample, vectors, sparse_vectors, dim, batch_size=256, **collection_options):
+    if client.collection_exists(collection_name):
+        client.delete_collection(collection_name)
+    create_collection(client, collection_name, dim, **collection_options)
+    points = create_points(sample, vectors, sparse_vectors)
+    for i in range(0, len(points), batch_size):
+        client.upsert(collection_name=collection_name, points=points[i:i + batch_size])
+
+
+def exact_top_k(doc_vectors, query_vectors, k, mask=None):
+    """Brute-force cosine ground truth: row indices of the k most similar docs per query."""
+    docs = doc_vectors / np.linalg.norm(doc_vectors, axis=1, keepdims=True)
+    queries = query_vectors / np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    scores = queries @ docs.T
+    if mask is not None:
+        scores[:, ~mask] = -np.inf
+    top = np.argpartition(-scores, kth=min(k, scores.shape[1] - 1), axis=1)[:, :k]
+    order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(top, order, axis=1)
+
+
+def run_variant(name, collection_name, queries, truth_ids, k, **search_kwargs):
+    latencies = []
+    recalls = []
+    for query, truth in zip(queries, truth_ids):
+        start = time.perf_counter()
+        points = RAG.search_points(query, collection_name, limit=k, **search_kwargs)
+        latencies.append(time.perf_counter() - start)
+        found = {str(p.id) for p in points}
+        recalls.append(len(found & truth) / len(truth) if truth else 1.0)
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "variant": name,
+        f"recall@{k}": float(np.mean(recalls)),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "qps": len(latencies) / float(np.sum(latencies)),
+    }
+
+
+def main(args):
+    # ":memory:" runs qdrant in-process, so the benchmark works offline without a server.
+    # Local mode accepts but does not apply quantization/HNSW settings; point --url at a
+    # real qdrant to measure those variants.
+    client = QdrantClient(":memory:") if args.url == ":memory:" else QdrantClient(args.url)
+    RAG.use_resources(qdrant_client=client)
+
+    sample = load_sample(args.csv_path, args.sample_size, seed=args.seed)
+    print(f"Sampled {len(sample)} docs")
+
+    embedding_model = load_embedding_model(RAG.model_handle)
+    vectors, elapsed = embed_texts(embedding_model, sample["text"].tolist())
+    print(f"Embedded {len(sample)} docs in {elapsed:.1f}s")
+    sparse_vectors, _ = embed_sparse(load_sparse_model(RAG.sparse_model_handle), sample["text"].tolist())
+    dim = vectors.shape[1]
+
+    # post titles stand in for user questions
+    rng = np.random.default_rng(args.seed)
+    query_rows = rng.choice(len(sample), size=min(args.num_queries, len(sample)), replace=False)
+    queries = [q for q in sample["post_title"].iloc[query_rows].tolist() if q.strip()]
+    # embed (and cache) all queries up front so the timings measure retrieval, not the encoder
+    query_vectors = np.array(RAG.embed_queries(queries, RAG.model_handle))
+    RAG.embed_queries(queries, RAG.sparse_model_handle)
+
+    point_ids = sample["point_id"].to_numpy()
+    truth = [set(point_ids[row]) for row in exact_top_k(vectors, query_vectors, args.k)]
+
+    top_subreddit = sample["subreddit"].value_counts().index[0]
+    filter_mask = (sample["subreddit"] == top_subreddit).to_numpy()
+    filtered_truth = [
+        set(point_ids[row][filter_mask[row]]) for row in exact_top_k(vectors, query_vectors, args.k, mask=filter_mask)
+    ]
+
+    variants = [
+        ("plain", {}),
+        ("scalar", {"quantization": "scalar"}),
+        ("binary", {"quantization": "binary"}),
+    ]
+    results = []
+    for name, options in tqdm(variants, desc="building collections"):
+        build_collection(client, f"bench_{name}", sample, vectors, sparse_vectors, dim, **options)
+
+    results.append(run_variant("dense", "bench_plain", queries, truth, args.k))
+    results.append(run_variant(f"dense hnsw_ef={args.hnsw_ef}", "bench_plain", queries, truth, args.k, hnsw_ef=args.hnsw_ef))
+    results.append(run_variant("hybrid (vs exact dense)", "bench_plain", queries, truth, args.k, mode="hybrid"))
+    results.append(run_variant(f"filtered subreddit={top_subreddit}", "bench_plain", queries, filtered_truth, args.k, filters={"subreddits": [top_subreddit]}))
+    results.append(run_variant("scalar int8", "bench_scalar", queries, truth, args.k))
+    results.append(run_variant(f"scalar int8 oversampling={args.oversampling}", "bench_scalar", queries, truth, args.k, oversampling=args.oversampling))
+    results.append(run_variant("binary", "bench_binary", queries, truth, args.k))
+    results.append(run_variant(f"binary oversampling={args.oversampling}", "bench_binary", queries, truth, args.k, oversampling=args.oversampling))
+
+    report = pd.DataFrame(results)
+    print(report.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv_path", type=str, default="/workspaces/reddit_search/data/reddit_posts_and_comments.csv", help="Reddit posts and comments csv")
+    parser.add_argument("--url", type=str, default=":memory:", help="Qdrant url, or :memory: for the in-process client")
+    parser.add_argument("--sample_size", type=int, default=10000, help="Docs indexed for the benchmark")
+    parser.add_argument("--num_queries", type=int, default=200, help="Queries sampled from post titles")
+    parser.add_argument("--k", type=int, default=5, help="Recall@k / result limit")
+    parser.add_argument("--hnsw_ef", type=int, default=128, help="hnsw_ef for the tuned dense variant")
+    parser.add_argument("--oversampling", type=float, default=2.0, help="Oversampling for the rescored quantized variants")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=str, default=None, help="Also write the results as json")
+    args = parser.parse_args()
+    main(args)
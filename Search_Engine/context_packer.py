@@ -0,0 +1,119 @@
+from collections import OrderedDict
+import tempfile
+import threading
+import glob
+import os
+
+# tokenizer used to count context tokens locally; any HF tokenizer close to the LLM's works,
+# if it can't be loaded we fall back to ~4 characters per token
+tokenizer_name = os.getenv("CONTEXT_TOKENIZER", "jinaai/jina-embeddings-v2-small-en")
+_tokenizer = None
+_tokenizer_loaded = False
+_tokenizer_lock = threading.Lock()
+
+
+def cached_tokenizer_path(name):
+    """tokenizer.json of `name` if fastembed already downloaded that model (same cache dir rules as fastembed)."""
+    cache_dir = os.getenv("FASTEMBED_CACHE_PATH", os.path.join(tempfile.gettempdir(), "fastembed_cache"))
+    pattern = os.path.join(cache_dir, f"models--{name.replace('/', '--')}", "snapshots", "*", "tokenizer.json")
+    matches = sorted(glob.glob(pattern))
+    return matches[-1] if matches else None
+
+
+def load_tokenizer(name):
+    """Tokenizer of a HF model, from fastembed's cache when it is there; None if it can't be loaded."""
+    try:
+        from tokenizers import Tokenizer
+        path = cached_tokenizer_path(name)
+        tokenizer = Tokenizer.from_file(path) if path else Tokenizer.from_pretrained(name)
+        tokenizer.no_truncation()
+        return tokenizer
+    except Exception as e:
+        print(f"Could not load tokenizer {name} ({e})")
+        return None
+
+
+def get_tokenizer():
+    # loaded once per process, RAG.warm_up() calls this so the first query doesn't pay for it;
+    # the default is the embedding model's tokenizer, read from fastembed's cache without network
+    global _tokenizer, _tokenizer_loaded
+    with _tokenizer_lock:
+        if not _tokenizer_loaded:
+            _tokenizer_loaded = True
+            _tokenizer = load_tokenizer(tokenizer_name)
+            if _tokenizer is None:
+                print("Estimating 4 chars per token for the context budget")
+    return _tokenizer
+
+
+def count_tokens(text):
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return (len(text) + 3) // 4
+    return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def trim_to_tokens(text, max_tokens):
+    """Cut text to at most max_tokens, ending on a token boundary."""
+    if max_tokens <= 0:
+        return ""
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return text if len(text) <= max_tokens * 4 else text[:max_tokens * 4].rsplit(" ", 1)[0] + " ..."
+    encoding = tokenizer.encode(text, add_special_tokens=False)
+    if len(encoding.ids) <= max_tokens:
+        return text
+    return text[:encoding.offsets[max_tokens - 1][1]] + " ..."
+
+
+def pack_context(search_results, token_budget=3000, max_post_tokens=400, max_comment_tokens=200, max_passage_tokens=300):
+    """
+    Build the CONTEXT block from search results within a token budget.
+
+    Hits are taken by score (retrieval order when there is no score), comments of the same
+    post are grouped under a single copy of the post, long posts/comments are trimmed, and
+    passages stop being added once the budget is reached. Hits from a chunked collection
+    contribute the passage that matched instead of the (possibly much longer) comment.
+    """
+    ordered = sorted(
+        enumerate(search_results),
+        key=lambda item: (-(item[1].get('score') or 0.0), item[0])
+    )
+
+    posts = OrderedDict()
+    used = 0
+    for _, doc in ordered:
+        key = doc.get('post_url') or doc.get('post_title')
+        passage = (doc.get('passage') or "").strip()
+        comment = passage or (doc.get('post_comment') or "").strip()
+
+        if key not in posts:
+            header = [
+                f"title: {doc.get('post_title', '')}",
+                f"content: {trim_to_tokens(doc.get('post_text') or '', max_post_tokens)}",
+                f"url: {doc.get('post_url', '')}",
+                f"subreddit: {doc.get('subreddit', '')}",
+                f"post_upvotes: {doc.get('post_upvotes', '')}",
+            ]
+            cost = count_tokens("\n".join(header))
+            if used + cost > token_budget:
+                continue
+            posts[key] = {"header": header, "comments": [], "seen": set()}
+            used += cost
+
+        post = posts[key]
+        if not comment or comment in post["seen"]:
+            continue
+        if passage:
+            line = f"passage: {trim_to_tokens(passage, max_passage_tokens)}"
+        else:
+            line = f"comment: {trim_to_tokens(comment, max_comment_tokens)}"
+        cost = count_tokens(line)
+        if used + cost > token_budget:
+            continue
+        post["comments"].append(line)
+        post["seen"].add(comment)
+        used += cost
+
+    blocks = ["\n".join(post["header"] + post["comments"]) for post in posts.values()]
+    return "\n\n".join(blocks)
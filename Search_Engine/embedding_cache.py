@@ -0,0 +1,129 @@
+from collections import OrderedDict
+import numpy as np
+import threading
+import sqlite3
+import json
+import time
+
+
+def normalize_query(text):
+    """Collapse whitespace and case so trivially different spellings of a question share a cache entry."""
+    return " ".join(text.split()).casefold()
+
+
+def encode_vector(value):
+    """sqlite form of a cached vector: raw float32 bytes for dense, json for sparse {"indices", "values"}."""
+    if isinstance(value, dict):
+        return json.dumps({key: np.asarray(v).tolist() for key, v in value.items()})
+    return np.asarray(value, dtype=np.float32).tobytes()
+
+
+def decode_vector(stored):
+    if isinstance(stored, bytes):
+        return np.frombuffer(stored, dtype=np.float32)
+    value = json.loads(stored)  # json text, also what older cache files hold for dense vectors
+    if isinstance(value, dict):
+        return {"indices": np.asarray(value["indices"], dtype=np.int32), "values": np.asarray(value["values"], dtype=np.float32)}
+    return np.asarray(value, dtype=np.float32)
+
+
+class EmbeddingCache:
+    """
+    LRU + TTL cache for query embeddings keyed on (model_handle, normalized query).
+
+    Values are float32 arrays (dense) or dicts of indices/values arrays (sparse), ~2 KB per
+    512-dim vector instead of ~16 KB as a list of Python floats.
+    With db_path set, entries are also written to a sqlite file so they survive restarts
+    and can be shared by several processes on the same host. Every prune_every writes,
+    expired rows and the oldest rows beyond maxsize are deleted from it.
+    """
+
+    def __init__(self, maxsize=10000, ttl=24 * 3600, db_path=None, prune_every=100):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.puts = 0
+        self.db = None
+        if db_path:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings "
+                "(model TEXT, query TEXT, vector TEXT, created_at REAL, PRIMARY KEY (model, query))"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS query_embeddings_created_at ON query_embeddings (created_at)")
+            self.db.commit()
+
+    def get(self, model_handle, query):
+        key = (model_handle, normalize_query(query))
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and now - entry[1] <= self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self.entries[key]
+
+            if self.db is not None:
+                row = self.db.execute(
+                    "SELECT vector, created_at FROM query_embeddings WHERE model = ? AND query = ?", key
+                ).fetchone()
+                if row is not None and now - row[1] <= self.ttl:
+                    value = decode_vector(row[0])
+                    self._remember(key, value, row[1])
+                    self.hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def put(self, model_handle, query, value):
+        key = (model_handle, normalize_query(query))
+        now = time.time()
+        with self.lock:
+            self._remember(key, value, now)
+            if self.db is not None:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO query_embeddings VALUES (?, ?, ?, ?)",
+                    (*key, encode_vector(value), now)
+                )
+                self.puts += 1
+                if self.puts % self.prune_every == 0:
+                    self._prune_db(now)
+                self.db.commit()
+
+    def _prune_db(self, now):
+        self.db.execute("DELETE FROM query_embeddings WHERE created_at < ?", (now - self.ttl,))
+        self.db.execute(
+            "DELETE FROM query_embeddings WHERE rowid IN "
+            "(SELECT rowid FROM query_embeddings ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.maxsize,)
+        )
+
+    def _remember(self, key, value, created_at):
+        self.entries[key] = (value, created_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self.entries),
+            }
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            if self.db is not None:
+                self.db.execute("DELETE FROM query_embeddings")
+                self.db.commit()
@@ -0,0 +1,210 @@
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import requests
+import asyncio
+import httpx
+from metrics import record_tokens
+import json
+import os
+
+
+def record_usage(body):
+    """Token counts from a completion body or the last stream event (Groq puts them under x_groq)."""
+    usage = body.get('usage') or body.get('x_groq', {}).get('usage')
+    if usage:
+        record_tokens(usage.get('prompt_tokens'), usage.get('completion_tokens'))
+
+
+class GroqClient:
+    """
+    Chat completion client for the Groq OpenAI-compatible API.
+
+    Holds one keep-alive requests.Session (connection pool) for the whole process,
+    retries 429/5xx and failed connects with exponential backoff and can stream the answer
+    token by token. Read errors are not retried: the server may already be generating (and
+    billing) the completion, re-POSTing it would pay for it again.
+    """
+
+    url = "https://api.groq.com/openai/v1/chat/completions"
+
+    def __init__(self, api_key=None, model="llama3-8b-8192", temperature=0.7, max_tokens=1024,
+                 timeout=(5, 60), max_retries=3, pool_size=10):
+        self.api_key = api_key or os.getenv('API_KEY')
+        self.model = model  # or "llama3-70b-8192" for larger model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.timeout = timeout  # (connect, read) seconds
+
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=0,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["POST"],
+            respect_retry_after_header=True,
+            raise_on_status=False,  # hand the last 429/5xx back to complete()/stream() instead of raising RetryError
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        })
+
+    def _payload(self, prompt, stream):
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "stream": stream
+        }
+
+    def complete(self, prompt):
+        try:
+            response = self.session.post(self.url, json=self._payload(prompt, False), timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            print(f"Error: {e}")
+            return None
+
+        if response.status_code == 200:
+            body = response.json()
+            record_usage(body)
+            return body['choices'][0]['message']['content']
+        else:
+            print(f"Error: {response.status_code}, {response.text}")
+            return None
+
+    def stream(self, prompt):
+        """Yield content deltas as the server-sent events arrive."""
+        try:
+            response = self.session.post(self.url, json=self._payload(prompt, True), timeout=self.timeout, stream=True)
+        except requests.exceptions.RequestException as e:
+            print(f"Error: {e}")
+            return
+
+        with response:
+            if response.status_code != 200:
+                print(f"Error: {response.status_code}, {response.text}")
+                return
+
+            response.encoding = "utf-8"
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    event = json.loads(data)
+                    record_usage(event)
+                    if not event.get('choices'):
+                        continue
+                    delta = event['choices'][0].get('delta', {})
+                    if delta.get('content'):
+                        yield delta['content']
+            except requests.exceptions.RequestException as e:
+                # connection dropped or read timeout mid-stream: end the answer, like the async client
+                print(f"Error: {e}")
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncGroqClient:
+    """Async twin of GroqClient on an httpx.AsyncClient connection pool, for asyncio callers."""
+
+    url = GroqClient.url
+    retry_statuses = (429, 500, 502, 503, 504)
+    # errors raised before the request reached the server; read errors are not retried (see GroqClient)
+    retry_errors = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+    def __init__(self, api_key=None, model="llama3-8b-8192", temperature=0.7, max_tokens=1024,
+                 timeout=60.0, max_retries=3, pool_size=20):
+        self.api_key = api_key or os.getenv('API_KEY')
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.max_retries = max_retries
+        self.client = httpx.AsyncClient(
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            },
+            timeout=httpx.Timeout(timeout, connect=5.0),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+
+    _payload = GroqClient._payload
+
+    async def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        delay = float(retry_after) if retry_after and retry_after.replace(".", "", 1).isdigit() else 0.5 * (2 ** attempt)
+        await asyncio.sleep(delay)
+
+    async def complete(self, prompt):
+        # 429/5xx and failed connects are retried, like the sync client
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.client.post(self.url, json=self._payload(prompt, False))
+            except httpx.TransportError as e:
+                if isinstance(e, self.retry_errors) and attempt < self.max_retries:
+                    await self._backoff(attempt)
+                    continue
+                print(f"Error: {e!r}")
+                return None
+            if response.status_code in self.retry_statuses and attempt < self.max_retries:
+                await self._backoff(attempt, response)
+                continue
+            break
+
+        if response.status_code == 200:
+            body = response.json()
+            record_usage(body)
+            return body['choices'][0]['message']['content']
+        else:
+            print(f"Error: {response.status_code}, {response.text}")
+            return None
+
+    async def stream(self, prompt):
+        """Async generator of content deltas. Retried like complete() until the first token is out."""
+        for attempt in range(self.max_retries + 1):
+            started = False
+            try:
+                async with self.client.stream("POST", self.url, json=self._payload(prompt, True)) as response:
+                    if response.status_code in self.retry_statuses and attempt < self.max_retries:
+                        await response.aread()
+                        await self._backoff(attempt, response)
+                        continue
+                    if response.status_code != 200:
+                        await response.aread()
+                        print(f"Error: {response.status_code}, {response.text}")
+                        return
+
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        event = json.loads(data)
+                        record_usage(event)
+                        if not event.get('choices'):
+                            continue
+                        delta = event['choices'][0].get('delta', {})
+                        if delta.get('content'):
+                            started = True
+                            yield delta['content']
+                    return
+            except httpx.TransportError as e:
+                if started or attempt == self.max_retries or not isinstance(e, self.retry_errors):
+                    print(f"Error: {e!r}")
+                    return
+                await self._backoff(attempt)
+
+    async def close(self):
+        await self.client.aclose()
@@ -0,0 +1,138 @@
+# Per-stage timing for the RAG pipeline: Prometheus metrics, optional OpenTelemetry spans
+# and a per-request trace dict that the UI can show as a latency breakdown.
+# opentelemetry is optional; without prometheus_client (a declared dependency) only the trace dict is kept.
+from contextlib import contextmanager
+import contextvars
+import functools
+import time
+
+try:
+    from prometheus_client import Counter, Histogram, generate_latest, start_http_server, CONTENT_TYPE_LATEST
+    from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, REGISTRY
+except ImportError:
+    Counter = Histogram = None
+
+try:
+    from opentelemetry import trace as otel_trace
+    tracer = otel_trace.get_tracer("reddit_rag")
+except ImportError:
+    tracer = None
+
+
+if Histogram is not None:
+    STAGE_SECONDS = Histogram("rag_stage_seconds", "Time spent per RAG stage", ["stage"])
+    STAGE_ERRORS = Counter("rag_stage_errors_total", "Exceptions raised per RAG stage", ["stage"])
+    RETRIEVED_HITS = Histogram("rag_retrieved_hits", "Points returned by search", buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100))
+    LLM_TOKENS = Counter("rag_llm_tokens_total", "Tokens reported by the LLM API", ["kind"])
+
+
+cache_stats = {}  # name -> stats() callable, read at scrape time
+
+
+class CacheStatsCollector:
+    """rag_<name>_hits_total, rag_<name>_misses_total and rag_<name>_size for every registered cache."""
+
+    def collect(self):
+        for name, stats in list(cache_stats.items()):
+            values = stats()
+            yield CounterMetricFamily(f"rag_{name}_hits", f"{name} hits", value=values["hits"])
+            yield CounterMetricFamily(f"rag_{name}_misses", f"{name} misses", value=values["misses"])
+            yield GaugeMetricFamily(f"rag_{name}_size", f"Entries in the {name}", value=values["size"])
+
+
+if Histogram is not None:
+    REGISTRY.register(CacheStatsCollector())
+
+
+def register_cache_stats(name, stats):
+    """Export a cache's stats() dict (hits, misses, size) with the other metrics."""
+    cache_stats[name] = stats
+
+
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def start_trace():
+    """Begin a new request trace; stages recorded afterwards in this context land in it."""
+    trace = {"stages": {}, "attributes": {}, "errors": []}
+    current_trace.set(trace)
+    return trace
+
+
+def get_trace():
+    return current_trace.get()
+
+
+def record_attribute(key, value, trace=None):
+    trace = trace or current_trace.get()
+    if trace is not None:
+        trace["attributes"][key] = value
+
+
+def record_hits(n_hits):
+    if Histogram is not None:
+        RETRIEVED_HITS.observe(n_hits)
+    record_attribute("retrieved_hits", n_hits)
+
+
+def record_tokens(prompt_tokens=None, completion_tokens=None, trace=None):
+    for kind, value in (("prompt", prompt_tokens), ("completion", completion_tokens)):
+        if value is None:
+            continue
+        if Counter is not None:
+            LLM_TOKENS.labels(kind=kind).inc(value)
+        record_attribute(f"{kind}_tokens", value, trace)
+
+
+@contextmanager
+def stage(name, trace=None, **attributes):
+    """Time a block as one pipeline stage (histogram + span + entry in the request trace)."""
+    trace = trace or current_trace.get()
+    span_cm = tracer.start_as_current_span(name, attributes=attributes) if tracer is not None else None
+    span = span_cm.__enter__() if span_cm is not None else None
+    start = time.perf_counter()
+    try:
+        yield span
+    except Exception as e:
+        if Counter is not None:
+            STAGE_ERRORS.labels(stage=name).inc()
+        if trace is not None:
+            trace["errors"].append(f"{name}: {e}")
+        if span is not None:
+            span.record_exception(e)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        if Histogram is not None:
+            STAGE_SECONDS.labels(stage=name).observe(elapsed)
+        if trace is not None:
+            trace["stages"][name] = trace["stages"].get(name, 0.0) + elapsed
+        if span_cm is not None:
+            span_cm.__exit__(None, None, None)
+
+
+def traced(name):
+    """Decorator form of stage() for plain functions."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_metrics_server(port):
+    """Expose /metrics for Prometheus on its own port (for processes without an HTTP server, e.g. Streamlit)."""
+    if Histogram is None:
+        print("prometheus_client is not installed, metrics server not started")
+        return False
+    start_http_server(port)
+    return True
+
+
+def metrics_payload():
+    """(body, content_type) of the Prometheus exposition, for serving /metrics from an existing app."""
+    if Histogram is None:
+        return b"", "text/plain"
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,40 @@
+import numpy as np
+
+
+def dense_vector(point):
+    """The unnamed dense vector of a point fetched with with_vectors=True (bm25 comes back next to it)."""
+    return point.vector.get("") if isinstance(point.vector, dict) else point.vector
+
+
+def mmr_select(query_vector, doc_vectors, k, lambda_mult=0.5):
+    """
+    Maximal Marginal Relevance: indices of k docs, each maximising
+    lambda * sim(query, doc) - (1 - lambda) * max sim(doc, already selected).
+
+    lambda_mult=1 is plain relevance order, lower values favour diversity.
+    """
+    docs = np.asarray(doc_vectors, dtype=np.float32)
+    docs = docs / np.maximum(np.linalg.norm(docs, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_vector, dtype=np.float32)
+    query = query / max(np.linalg.norm(query), 1e-12)
+
+    relevance = docs @ query
+    similarity = docs @ docs.T
+    redundancy = np.zeros(len(docs), dtype=np.float32)
+    available = np.ones(len(docs), dtype=bool)
+    selected = []
+    for _ in range(min(k, len(docs))):
+        scores = np.where(available, lambda_mult * relevance - (1 - lambda_mult) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+    return selected
+
+
+def mmr_points(query_vector, points, k, lambda_mult=0.5):
+    """MMR over retrieved points that carry their vectors; the input order is kept among equals."""
+    if len(points) <= 1:
+        return points[:k]
+    order = mmr_select(query_vector, [dense_vector(point) for point in points], k, lambda_mult=lambda_mult)
+    return [points[i] for i in order]
@@ -0,0 +1,118 @@
+import pandas as pd
+import numpy as np
+
+MERSENNE = np.uint64((1 << 31) - 1)  # keeps a*x+b inside uint64 for 31-bit a and x
+
+
+def lsh_params(threshold, num_perm):
+    """
+    (bands, rows) with bands*rows == num_perm whose S-curve midpoint (1/b)^(1/r) is the highest
+    one at or below threshold: candidates are verified on the full signature, so LSH errs on recall.
+    """
+    options = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    midpoint = lambda br: (1 / br[0]) ** (1 / br[1])
+    below = [br for br in options if midpoint(br) <= threshold]
+    return max(below, key=midpoint) if below else min(options, key=midpoint)
+
+
+class NearDuplicateFilter:
+    """
+    MinHash/LSH filter for copy-paste and bot comments, stateful across csv chunks.
+
+    Comments are shingled into word n-grams, signed with num_perm MinHash permutations
+    (NumPy, in blocks) and bucketed by LSH bands. A comment whose estimated Jaccard
+    similarity to an earlier kept comment is >= threshold is a duplicate; the first
+    occurrence is kept. Comments shorter than min_words are never treated as duplicates.
+    """
+
+    def __init__(self, threshold=0.9, num_perm=128, shingle_size=3, min_words=5, seed=1, block_size=100000):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.min_words = max(min_words, shingle_size)
+        self.block_size = block_size
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, MERSENNE, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, MERSENNE, size=num_perm, dtype=np.uint64)
+        self.band_mult = rng.integers(1, 2**63, size=self.rows, dtype=np.uint64)
+        self.buckets = [{} for _ in range(self.bands)]  # band hash -> index of a kept signature
+        # signatures of kept comments: one preallocated uint32 matrix, doubled when full, instead of
+        # an object per comment (128 perms = 512 bytes per kept comment)
+        self.kept = np.empty((1024, num_perm), dtype=np.uint32)
+        self.n_kept = 0
+        self.removed = 0
+
+    def shingles(self, texts):
+        """Hashed word n-grams of the long enough texts: (doc row numbers, shingle hashes, shingle start offsets)."""
+        words = pd.Series(texts, dtype=object).fillna("").str.lower().str.findall(r"\w+")
+        lengths = words.str.len().to_numpy()
+        docs = np.flatnonzero(lengths >= self.min_words)
+        if len(docs) == 0:
+            return docs, np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64)
+
+        lengths = lengths[docs]
+        flat = words.iloc[docs].explode().to_numpy(dtype=object)
+        word_hash = pd.util.hash_array(flat) & np.uint64(0xFFFFFFFF)
+
+        # n-gram hash = polynomial combination of consecutive word hashes (wraps mod 2**64)
+        k = self.shingle_size
+        n_shingles = len(word_hash) - k + 1
+        shingle_hash = np.zeros(n_shingles, dtype=np.uint64)
+        for j in range(k):
+            shingle_hash = shingle_hash * np.uint64(1000003) + word_hash[j:j + n_shingles]
+
+        # drop the n-grams that would span two comments
+        word_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        position = np.arange(n_shingles) - np.repeat(word_starts, lengths)[:n_shingles]
+        valid = position <= np.repeat(lengths - k, lengths)[:n_shingles]
+        counts = lengths - k + 1
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        return docs, shingle_hash[valid] % MERSENNE, starts
+
+    def signatures(self, shingle_hash, starts):
+        """MinHash signature per document, shingle hashes are contiguous per document from starts."""
+        n_docs = len(starts)
+        ends = np.append(starts[1:], len(shingle_hash))
+        sigs = np.empty((n_docs, self.num_perm), dtype=np.uint32)
+        first = 0
+        while first < n_docs:
+            # as many whole documents as fit in one (num_perm, block_size) matrix
+            last = max(int(np.searchsorted(ends, starts[first] + self.block_size, side="right")), first + 1)
+            lo, hi = starts[first], ends[last - 1]
+            hashed = (self.a[:, None] * shingle_hash[None, lo:hi] + self.b[:, None]) % MERSENNE
+            sigs[first:last] = np.minimum.reduceat(hashed, starts[first:last] - lo, axis=1).T
+            first = last
+        return sigs
+
+    def _keep(self, sig):
+        if self.n_kept == len(self.kept):
+            grown = np.empty((2 * len(self.kept), self.num_perm), dtype=np.uint32)
+            grown[:self.n_kept] = self.kept
+            self.kept = grown
+        self.kept[self.n_kept] = sig
+        self.n_kept += 1
+        return self.n_kept - 1
+
+    def keep_mask(self, texts):
+        """Boolean mask over texts, False for near-duplicates of an already kept comment (this or earlier chunks)."""
+        keep = np.ones(len(texts), dtype=bool)
+        docs, shingle_hash, starts = self.shingles(texts)
+        if len(docs) == 0:
+            return keep
+
+        sigs = self.signatures(shingle_hash, starts)
+        band_hashes = (sigs.reshape(len(sigs), self.bands, self.rows).astype(np.uint64) * self.band_mult).sum(axis=2)
+
+        for doc, sig, bands in zip(docs, sigs, band_hashes.tolist()):
+            candidates = {self.buckets[band].get(h) for band, h in enumerate(bands)}
+            candidates.discard(None)
+            if candidates and (self.kept[list(candidates)] == sig).mean(axis=1).max() >= self.threshold:
+                keep[doc] = False
+                continue
+            index = self._keep(sig)
+            for band, h in enumerate(bands):
+                self.buckets[band].setdefault(h, index)
+
+        self.removed += int((~keep).sum())
+        return keep
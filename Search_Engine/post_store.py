@@ -0,0 +1,159 @@
+from qdrant_client import models
+from upload_engine import upsert_with_retry, write_failed_batch
+from collections import OrderedDict
+import numpy as np
+import uuid
+
+# post payload kept once per post in the store instead of on every comment point
+post_fields = ['post_title', 'post_text']
+
+
+def post_store_name(collection_name):
+    return f"{collection_name}_posts"
+
+
+def make_post_id(post_url):
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, post_url))
+
+
+def unit_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def missing_post_ids(payloads):
+    """Post ids of comment payloads (normalized layout) that still need their post fields."""
+    return list({p["post_id"] for p in payloads if p.get("post_id") and "post_title" not in p})
+
+
+def merge_posts(payloads, records):
+    """Copy post_title/post_text from post store records into the comment payloads, in place."""
+    posts = {str(record.id): record.payload or {} for record in records}
+    for payload in payloads:
+        post = posts.get(payload.get("post_id"))
+        if post is not None:
+            for field in post_fields:
+                payload.setdefault(field, post.get(field))
+    return payloads
+
+
+def missing_parent_ids(payloads):
+    """Passages past the first of a split row don't store the post body, passage 0 (id == parent_id) does."""
+    return list({p["parent_id"] for p in payloads if p.get("passage") and p.get("parent_id") and "post_text" not in p})
+
+
+def merge_parents(payloads, records):
+    parents = {str(record.id): record.payload or {} for record in records}
+    for payload in payloads:
+        if "post_text" not in payload and payload.get("passage"):
+            parent = parents.get(payload.get("parent_id"))
+            if parent is not None:
+                payload["post_text"] = parent.get("post_text")
+    return payloads
+
+
+def rehydrate(client, collection_name, points):
+    """Fill the post fields of hits from a normalized collection with one retrieve() call; no-op otherwise."""
+    payloads = [point.payload for point in points if point.payload is not None]
+    post_ids = missing_post_ids(payloads)
+    if post_ids:
+        records = client.retrieve(collection_name=post_store_name(collection_name), ids=post_ids, with_payload=post_fields, with_vectors=False)
+        merge_posts(payloads, records)
+    # normalized collections got post_text from the store above, the others read it from passage 0
+    parent_ids = missing_parent_ids(payloads)
+    if parent_ids:
+        records = client.retrieve(collection_name=collection_name, ids=parent_ids, with_payload=["post_text"], with_vectors=False)
+        merge_parents(payloads, records)
+    return points
+
+
+class PostStore:
+    """
+    Posts of a normalized collection, kept in `<collection>_posts`.
+
+    Each post is embedded once and stored as one point (title, text, url and the post
+    vector); comment points only carry its post_id. Post vectors of recent posts stay in
+    memory so the comments of popular posts, spread over csv chunks, reuse them, older
+    unchanged posts are read back from the store instead of being embedded again.
+    """
+
+    def __init__(self, client, collection_name, cache_size=50000, manifest_path="failed_batches.jsonl"):
+        self.client = client
+        self.name = post_store_name(collection_name)
+        self.cache_size = cache_size
+        self.manifest_path = manifest_path
+        self.vectors = OrderedDict()  # post_id -> (content_hash, vector)
+        self.indexed = {}  # post_id -> content_hash in the store (filled from qdrant in incremental mode)
+        self.seen = set()
+        self.stats = {"embedded": 0, "reused": 0, "failed_batches": 0}
+
+    def create(self, dim, on_disk=False):
+        if self.client.collection_exists(self.name):
+            self.client.delete_collection(self.name)
+        self.client.create_collection(
+            collection_name=self.name,
+            vectors_config=models.VectorParams(size=dim, distance=models.Distance.COSINE, on_disk=on_disk)
+        )
+
+    def _remember(self, post_id, content_hash, vector):
+        self.vectors[post_id] = (content_hash, vector)
+        self.vectors.move_to_end(post_id)
+        while len(self.vectors) > self.cache_size:
+            self.vectors.popitem(last=False)
+
+    def _read_back(self, post_ids):
+        records = self.client.retrieve(collection_name=self.name, ids=post_ids, with_payload=False, with_vectors=True)
+        return {str(record.id): record.vector for record in records}
+
+    def post_vectors(self, posts, embed):
+        """
+        Vectors for a frame of unique posts (post_id, text, content_hash, post fields), aligned with its rows.
+
+        `embed` turns a list of texts into an array; only new or changed posts go through it
+        and are upserted to the store.
+        """
+        vectors = [None] * len(posts)
+        records = posts.to_dict("records")
+        for i, post in enumerate(records):
+            cached = self.vectors.get(post["post_id"])
+            if cached is not None and cached[0] == post["content_hash"]:
+                vectors[i] = cached[1]
+
+        stored = [i for i, post in enumerate(records) if vectors[i] is None and self.indexed.get(post["post_id"]) == post["content_hash"]]
+        if stored:
+            found = self._read_back([records[i]["post_id"] for i in stored])
+            for i in stored:
+                vectors[i] = found.get(records[i]["post_id"])
+
+        missing = [i for i in range(len(records)) if vectors[i] is None]
+        self.stats["reused"] += len(records) - len(missing)
+        if missing:
+            embedded = embed([records[i]["text"] for i in missing])
+            points = []
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+                points.append(models.PointStruct(
+                    id=records[i]["post_id"],
+                    vector=np.asarray(vector).tolist(),
+                    payload={field: records[i][field] for field in post_fields + ["post_url", "content_hash"]}
+                ))
+            self.stats["embedded"] += len(missing)
+            self.upsert(points)
+            # once in the store, an evicted post is read back rather than embedded again
+            self.indexed.update((records[i]["post_id"], records[i]["content_hash"]) for i in missing)
+
+        for post, vector in zip(records, vectors):
+            self._remember(post["post_id"], post["content_hash"], vector)
+        return np.vstack(vectors)
+
+    def upsert(self, points, batch_size=256):
+        for i in range(0, len(points), batch_size):
+            batch = points[i:i + batch_size]
+            error = upsert_with_retry(self.client, self.name, batch)
+            if error is not None:
+                self.stats["failed_batches"] += 1
+                write_failed_batch(self.manifest_path, self.name, i // batch_size + 1, batch, error)
+
+    def vanished(self):
+        return self.indexed.keys() - self.seen
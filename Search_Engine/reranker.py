@@ -0,0 +1,46 @@
+from fastembed.rerank.cross_encoder import TextCrossEncoder
+import time
+
+# cross-encoder used by search(rerank=True), small enough for CPU inference on ~50 candidates
+rerank_model_handle = "Xenova/ms-marco-MiniLM-L-6-v2"
+# payload fields the cross-encoder reads, requested from qdrant on top of the caller's fields
+rerank_fields = ['post_title', 'post_text', 'post_comment', 'passage']
+
+
+def load_rerank_model(handle=rerank_model_handle):
+    return TextCrossEncoder(model_name=handle)
+
+
+def rerank_text(payload, max_post_chars=1000):
+    """What the cross-encoder sees for one hit: title, the start of the post and the comment (or the matched passage)."""
+    if payload.get('passage'):
+        return ". ".join(part.strip() for part in (payload.get('post_title') or "", payload['passage']) if part.strip())
+    parts = [payload.get('post_title') or "", (payload.get('post_text') or "")[:max_post_chars], payload.get('post_comment') or ""]
+    return ". ".join(part.strip() for part in parts if part and part.strip())
+
+
+def rerank_points(model, query, points, top_k=5, batch_size=16, budget=None):
+    """
+    Rescore retrieved points with a cross-encoder and return the top_k, best first.
+
+    Candidates are scored in retrieval order, batch by batch. With a latency budget (seconds)
+    scoring stops before the batch that would exceed it, and the candidates not scored yet
+    are dropped, so a slow CPU trades recall for latency instead of blowing the budget.
+    point.score is replaced by the cross-encoder score.
+    """
+    start = time.perf_counter()
+    scored = []
+    for i in range(0, len(points), batch_size):
+        batch = points[i:i + batch_size]
+        texts = [rerank_text(point.payload or {}) for point in batch]
+        for point, score in zip(batch, model.rerank(query, texts, batch_size=batch_size)):
+            point.score = float(score)
+            scored.append(point)
+
+        elapsed = time.perf_counter() - start
+        per_batch = elapsed / (i // batch_size + 1)
+        if budget is not None and elapsed + per_batch > budget:
+            break
+
+    scored.sort(key=lambda point: point.score, reverse=True)
+    return scored[:top_k]
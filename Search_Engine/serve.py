@@ -0,0 +1,149 @@
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, Response
+from pydantic import BaseModel, ConfigDict
+from typing import Literal
+from qdrant_client import QdrantClient
+from llm_client import GroqClient
+from metrics import metrics_payload
+import RAG
+import asyncio
+import argparse
+import json
+import os
+
+# seconds a single request may spend in search/LLM before we give up with a 504
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "60"))
+
+state = {"ready": False}
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # one pooled qdrant client and Groq session per worker process, models loaded before traffic arrives
+    RAG.use_resources(qdrant_client=QdrantClient(RAG.qdrant_url), llm=GroqClient())
+    await run_in_threadpool(RAG.warm_up)
+    state["ready"] = True
+    yield
+    state["ready"] = False
+    RAG.get_llm_client().close()
+
+
+app = FastAPI(title="Reddit RAG", lifespan=lifespan)
+
+
+class Filters(BaseModel):
+    """RAG.build_filter() arguments; unknown keys are a 422 instead of a TypeError inside the search."""
+    model_config = ConfigDict(extra="forbid")
+
+    subreddits: list[str] | None = None
+    authors: list[str] | None = None
+    min_upvotes: int | None = None
+
+
+def filter_kwargs(filters):
+    return filters.model_dump() if filters is not None else None
+
+
+class SearchRequest(BaseModel):
+    query: str
+    collection_name: str = RAG.collection_name
+    limit: int = 5
+    mode: Literal["dense", "hybrid"] = "dense"
+    payload_fields: list[str] | None = None
+    filters: Filters | None = None
+    group_by_parent: bool = False
+    rerank: bool = False
+    min_score: float | None = None
+    mmr: bool = False
+
+
+class PromptRequest(BaseModel):
+    query: str
+    search_results: list[dict]
+
+
+class RAGRequest(BaseModel):
+    query: str
+    collection_name: str = RAG.collection_name
+    mode: Literal["dense", "hybrid"] = "dense"
+    use_cache: bool = True
+    filters: Filters | None = None
+    group_by_parent: bool = False
+    rerank: bool = False
+    min_score: float | None = None
+    mmr: bool = False
+
+
+async def with_timeout(func, *args, **kwargs):
+    try:
+        return await asyncio.wait_for(run_in_threadpool(func, *args, **kwargs), timeout=REQUEST_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Timed out after {REQUEST_TIMEOUT}s")
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+async def ready():
+    if not state["ready"]:
+        raise HTTPException(status_code=503, detail="warming up")
+    try:
+        await with_timeout(RAG.get_client().get_collections)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"qdrant unavailable: {e}")
+    return {"status": "ready"}
+
+
+@app.get("/metrics")
+async def metrics():
+    body, content_type = metrics_payload()
+    return Response(content=body, media_type=content_type)
+
+
+@app.post("/search")
+async def search(request: SearchRequest):
+    results = await with_timeout(RAG.search, request.query, request.collection_name, limit=request.limit, mode=request.mode, payload_fields=request.payload_fields, filters=filter_kwargs(request.filters), group_by_parent=request.group_by_parent, rerank=request.rerank, min_score=request.min_score, mmr=request.mmr)
+    return {"results": results}
+
+
+@app.post("/prompt")
+async def prompt(request: PromptRequest):
+    # token counting is CPU work, keep it off the event loop like the other endpoints
+    return {"prompt": await with_timeout(RAG.build_prompt, request.query, request.search_results)}
+
+
+@app.post("/rag")
+async def rag(request: RAGRequest):
+    answer = await with_timeout(RAG.rag_pipeline, request.query, request.collection_name, mode=request.mode, use_cache=request.use_cache, filters=filter_kwargs(request.filters), group_by_parent=request.group_by_parent, rerank=request.rerank, min_score=request.min_score, mmr=request.mmr)
+    if answer is None:
+        raise HTTPException(status_code=502, detail="LLM call failed")
+    return {"answer": answer}
+
+
+@app.post("/rag/stream")
+async def rag_stream(request: RAGRequest):
+    """Server-sent events: one `data: {"token": ...}` per chunk, then `data: [DONE]`."""
+    chunks = await with_timeout(RAG.rag_pipeline, request.query, request.collection_name, mode=request.mode, use_cache=request.use_cache, stream=True, filters=filter_kwargs(request.filters), group_by_parent=request.group_by_parent, rerank=request.rerank, min_score=request.min_score, mmr=request.mmr)
+
+    def events():
+        for chunk in chunks:
+            yield f"data: {json.dumps({'token': chunk})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=2, help="Worker processes, each with its own pooled clients")
+    args = parser.parse_args()
+    uvicorn.run("serve:app", host=args.host, port=args.port, workers=args.workers)
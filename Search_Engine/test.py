@@ -1,8 +1,16 @@
 from qdrant_client import QdrantClient, models
+from fastembed import TextEmbedding, SparseTextEmbedding
 from datetime import datetime
 import pandas as pd 
 import numpy as np 
-from tqdm import tqdm
+from upload_engine import parallel_upsert, replay_failed_batches
+from answer_cache import SemanticAnswerCache
+from near_dedup import NearDuplicateFilter
+from post_store import PostStore, post_store_name, post_fields, make_post_id, unit_rows
+from context_packer import load_tokenizer
+import hashlib
+import re
+import uuid
 import time
 import argparse
 
@@ -12,19 +20,62 @@ def data_preprocessing(df):
     return df 
 
 
-def create_collection(client, collection_name,dim): 
+def quantization_config(quantization, always_ram=True): 
+    """int8 scalar quantization keeps ~4x fewer bytes per vector, binary ~32x; always_ram keeps the quantized copy in RAM."""
+    if quantization == "scalar":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                quantile=0.99,
+                always_ram=always_ram
+            )
+        )
+    if quantization == "binary":
+        return models.BinaryQuantization(
+            binary=models.BinaryQuantizationConfig(always_ram=always_ram)
+        )
+    return None
+
+
+def create_collection(client, collection_name,dim, quantization=None, on_disk=False, hnsw_m=None, hnsw_ef_construct=None): 
+    # on_disk moves the original float32 vectors to disk (mmap); with quantization the
+    # in-RAM quantized vectors serve the search and the originals are only read for rescoring
+    hnsw_config = None
+    if hnsw_m is not None or hnsw_ef_construct is not None:
+        hnsw_config = models.HnswConfigDiff(m=hnsw_m, ef_construct=hnsw_ef_construct)
+
     client.create_collection(
         collection_name=collection_name,
         vectors_config=models.VectorParams(
             size=dim,  # for sentence-transformers embeddings
-            distance=models.Distance.COSINE
+            distance=models.Distance.COSINE,
+            on_disk=on_disk
         ),
         sparse_vectors_config={
             "bm25": models.SparseVectorParams(
                 modifier=models.Modifier.IDF,
             )
-        }
+        },
+        quantization_config=quantization_config(quantization),
+        hnsw_config=hnsw_config
     )
+    create_payload_indexes(client, collection_name)
+    return None 
+
+
+def create_payload_indexes(client, collection_name): 
+    """Indexes for the fields search() can filter on, so filtered queries don't scan payloads."""
+    for field_name, schema in [
+        ("parent_id", models.PayloadSchemaType.KEYWORD),  # group_by in search(group_by_parent=True)
+        ("subreddit", models.PayloadSchemaType.KEYWORD),
+        ("post_author", models.PayloadSchemaType.KEYWORD),
+        ("post_upvotes", models.PayloadSchemaType.INTEGER),
+    ]:
+        client.create_payload_index(
+            collection_name=collection_name,
+            field_name=field_name,
+            field_schema=schema
+        )
     return None 
 
 
@@ -48,111 +99,435 @@ def truncate_text(text, max_length=4000):
         return truncated
 
 
-def create_points(input_df,model_handle): 
+def make_point_id(post_url, comment):
+    """Deterministic point id: the same post_url + comment always maps to the same uuid."""
+    comment_hash = hashlib.sha1(comment.encode("utf-8")).hexdigest()
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{post_url}#{comment_hash}"))
+
+
+def content_hash(*fields):
+    return hashlib.sha1("\x1f".join(str(f) for f in fields).encode("utf-8")).hexdigest()
+
+
+def prepare_chunk(chunk, max_length=4000, normalize_posts=False):
+    """
+    Columnar version of the per-row cleaning: fill nulls, combine, filter empties, truncate.
+
+    With normalize_posts the embedded text is only the comment (the title when it is empty) and
+    rows get the post_id of their post, whose title and body are embedded once by the PostStore
+    (see post_frame) and mixed into the comment vector.
+    """
+    title = chunk['post_title'].fillna("").astype(str)
+    text = chunk['post_text'].fillna("").astype(str)
+    comment = chunk['comment_text'].fillna("").astype(str)
+    combined = (title + ". " + text + ". " + comment).str.strip(". ")
+
+    # Skip if essentially empty
+    keep = (combined != "") & (combined != "No content")
+    skipped_empty = int((~keep).sum())
+
+    prepared = pd.DataFrame({
+        "post_title": title[keep],
+        "post_text": text[keep],
+        "post_comment": comment[keep],
+        "subreddit": chunk.loc[keep, 'subreddit'].fillna("").astype(str),
+        "post_author": chunk.loc[keep, 'post_author'].fillna("").astype(str),
+        "post_url": chunk.loc[keep, 'post_url'].fillna("").astype(str),
+        "post_upvotes": pd.to_numeric(chunk.loc[keep, 'post_upvotes'], errors="coerce").fillna(0).astype(int),
+        "post_downvotes": pd.to_numeric(chunk.loc[keep, 'post_downvotes'], errors="coerce").fillna(0).astype(int),
+    })
+    combined = combined[keep]
+    if normalize_posts:
+        combined = comment.where(comment.str.strip() != "", title)[keep]
+
+    # Truncate if too long, only the long rows go through the python helper
+    # (max_length=None keeps full texts, for when chunk_passages splits them instead)
+    too_long = combined.str.len() > (max_length or np.inf)
+    if too_long.any():
+        combined = combined.copy()
+        combined[too_long] = combined[too_long].map(lambda t: truncate_text(t, max_length=max_length))
+
+    prepared.insert(0, "text", combined)
+    prepared["text_length"] = combined.str.len()
+    prepared["was_truncated"] = too_long
+    prepared["point_id"] = [make_point_id(url, c) for url, c in zip(prepared["post_url"], prepared["post_comment"])]
+    # every point points at the post+comment row it came from, passages of one row share it
+    prepared["parent_id"] = prepared["point_id"]
+    prepared["chunk_index"] = 0
+    prepared["chunk_count"] = 1
+    hash_fields = [prepared["text"], prepared["subreddit"], prepared["post_author"], prepared["post_upvotes"], prepared["post_downvotes"]]
+    if normalize_posts:
+        # link posts without a url are keyed by their title
+        post_keys = prepared["post_url"].where(prepared["post_url"] != "", prepared["post_title"])
+        post_ids = {key: make_post_id(key) for key in post_keys.unique()}
+        prepared["post_id"] = post_keys.map(post_ids)
+        # the comment vector mixes in the post vector, so editing a post has to re-embed its comments
+        hash_fields += [prepared["post_title"], prepared["post_text"]]
+    prepared["content_hash"] = [content_hash(*row) for row in zip(*hash_fields)]
+    return prepared.reset_index(drop=True), skipped_empty
+
+
+def post_frame(prepared, max_length=4000):
+    """One row per post of a prepare_chunk(normalize_posts=True) frame, with the text embedded for the post."""
+    posts = prepared.drop_duplicates("post_id")[["post_id", "post_title", "post_text", "post_url"]].reset_index(drop=True)
+    text = (posts["post_title"] + ". " + posts["post_text"]).str.strip(". ")
+    posts["text"] = [truncate_text(t, max_length=max_length) for t in text]
+    posts["content_hash"] = [content_hash(title, body) for title, body in zip(posts["post_title"], posts["post_text"])]
+    return posts
+
+
+def mix_post_vectors(prepared, comment_vectors, post_store, embed, max_length=4000):
+    """Comment vector = mean of the unit comment and unit post vectors, each post embedded (at most) once."""
+    posts = post_frame(prepared, max_length=max_length)
+    post_vectors = post_store.post_vectors(posts, embed)
+    rows = prepared["post_id"].map(pd.Series(np.arange(len(posts)), index=posts["post_id"])).to_numpy()
+    return unit_rows(unit_rows(comment_vectors) + unit_rows(post_vectors)[rows])
+
+
+def split_passages(text, chunk_tokens=256, overlap=32, tokenizer=None):
+    """Overlapping windows of ~chunk_tokens tokens of `tokenizer` (whitespace words without one)."""
+    if tokenizer is not None:
+        spans = tokenizer.encode(text, add_special_tokens=False).offsets
+    else:
+        spans = [m.span() for m in re.finditer(r"\S+", text)]
+    if len(spans) <= chunk_tokens:
+        return [text]
+
+    step = max(chunk_tokens - overlap, 1)
+    passages = []
+    for start in range(0, len(spans), step):
+        window = spans[start:start + chunk_tokens]
+        passages.append(text[window[0][0]:window[-1][1]])
+        if start + chunk_tokens >= len(spans):
+            break
+    return passages
+
+
+def chunk_passages(prepared, chunk_tokens=256, overlap=32, tokenizer=None):
+    """
+    Replace long texts by overlapping passages, one row (and later one point) each.
+
+    Passage 0 keeps the row's point_id so short texts index exactly as before; later
+    passages get a uuid5 derived from it. All passages carry the row's id as parent_id,
+    only passage 0 keeps the full post/comment (see create_points).
+    """
+    # a token covers at least one character, so shorter texts can't need splitting
+    long_rows = prepared["text"].str.len() > chunk_tokens
+    if not long_rows.any():
+        return prepared
+
+    passages = [
+        split_passages(t, chunk_tokens, overlap, tokenizer) if is_long else [t]
+        for t, is_long in zip(prepared["text"], long_rows)
+    ]
+
+    exploded = prepared.assign(text=passages).explode("text")
+    exploded["chunk_index"] = exploded.groupby(level=0).cumcount()
+    exploded["chunk_count"] = exploded.groupby(level=0)["text"].transform("size")
+    exploded = exploded.reset_index(drop=True)
+
+    split = exploded["chunk_index"] > 0
+    exploded.loc[split, "point_id"] = [
+        str(uuid.uuid5(uuid.NAMESPACE_URL, f"{parent}#{i}"))
+        for parent, i in zip(exploded.loc[split, "parent_id"], exploded.loc[split, "chunk_index"])
+    ]
+    exploded["content_hash"] = [
+        content_hash(h, i, t) for h, i, t in zip(exploded["content_hash"], exploded["chunk_index"], exploded["text"])
+    ]
+    exploded["text_length"] = exploded["text"].str.len()
+    return exploded
+
+
+def load_embedding_model(model_handle="jinaai/jina-embeddings-v2-small-en"): 
+    return TextEmbedding(model_name=model_handle)
+
+
+def load_sparse_model(sparse_model_handle="Qdrant/bm25"): 
+    return SparseTextEmbedding(model_name=sparse_model_handle)
+
+
+def embed_sparse(sparse_model, texts, batch_size=256, parallel=None): 
+    """BM25 term weights for the "bm25" sparse vector, the IDF part is applied by qdrant (Modifier.IDF)."""
+    start = time.perf_counter()
+    sparse_vectors = [
+        models.SparseVector(indices=emb.indices.tolist(), values=emb.values.tolist())
+        for emb in sparse_model.embed(texts, batch_size=batch_size, parallel=parallel)
+    ]
+    elapsed = time.perf_counter() - start
+    return sparse_vectors, elapsed
+
+
+def embed_texts(embedding_model, texts, batch_size=256, parallel=None): 
+    """Encode texts locally in large batches, parallel=N spreads the work over N worker processes (0 = all cores)."""
+    start = time.perf_counter()
+    vectors = np.vstack(list(embedding_model.embed(texts, batch_size=batch_size, parallel=parallel)))
+    elapsed = time.perf_counter() - start
+    return vectors, elapsed
+
+
+def create_points(input_df, vectors, sparse_vectors=None, store_text=True): 
+    """Build points from a frame that already went through prepare_chunk and its dense (and bm25) vectors."""
     filtered_points = []
-    skipped_empty = 0
-    truncated_count = 0
-    id = 0
-
-    for idx, row in input_df.iterrows():
-        # Combine title and text
-        title = str(row['post_title']) if pd.notna(row['post_title']) else ""
-        text = str(row['post_text']) if pd.notna(row['post_text']) else ""
-        comment = str(row['comment_text']) if pd.notna(row['comment_text']) else ""
-        combined_text = f"{title}. {text}. {comment}".strip(". ")
-
-        # Skip if essentially empty
-        if not combined_text or combined_text == "No content":
-            skipped_empty += 1
-            continue
-
-        # Truncate if too long
-        original_length = len(combined_text)
-        combined_text = truncate_text(combined_text, max_length=4000)
-
-        if len(combined_text) < original_length:
-            truncated_count += 1
+    records = input_df.to_dict("records")
+    if sparse_vectors is None:
+        sparse_vectors = [None] * len(records)
+
+    for payload, vector, sparse_vector in zip(records, vectors, sparse_vectors):
+        point_id = payload.pop("point_id")
+        if payload["chunk_count"] > 1:
+            # a passage of a split row: search() shows its own text, and only passage 0 keeps
+            # the full post/comment so a post split into N passages isn't stored N times
+            payload["passage"] = payload.pop("text")
+            if payload["chunk_index"] > 0:
+                payload.pop("post_text", None)
+                payload.pop("post_comment", None)
+        elif not store_text:
+            # "text" is just title + post + comment again, search() never reads it
+            del payload["text"]
+        # numpy scalars are not JSON serialisable for the qdrant payload
+        payload["post_upvotes"] = int(payload["post_upvotes"])
+        payload["post_downvotes"] = int(payload["post_downvotes"])
+        payload["text_length"] = int(payload["text_length"])
+        payload["was_truncated"] = bool(payload["was_truncated"])
+        payload["chunk_index"] = int(payload["chunk_index"])
+        payload["chunk_count"] = int(payload["chunk_count"])
+
+        point_vector = vector.tolist()
+        if sparse_vector is not None:
+            # "" is the unnamed dense vector declared in create_collection
+            point_vector = {"": point_vector, "bm25": sparse_vector}
 
         point = models.PointStruct(
-            id=id,
-            vector=models.Document(
-                text=combined_text, 
-                model=model_handle
-            ),
-            payload={
-                "text": combined_text,
-                "post_title": title,
-                "post_text": str(row['post_text']) if pd.notna(row['post_text']) else "",
-                "post_comment": str(row['comment_text']) if pd.notna(row['comment_text']) else "",
-                "subreddit": str(row['subreddit']) if pd.notna(row['subreddit']) else "",
-                "post_author": str(row['post_author']) if pd.notna(row['post_author']) else "",
-                "post_url": str(row['post_url']) if pd.notna(row['post_url']) else "",
-                "post_upvotes": int(row['post_upvotes']) if pd.notna(row['post_upvotes']) else 0,
-                "post_downvotes": int(row['post_downvotes']) if pd.notna(row['post_downvotes']) else 0,
-                "text_length": len(combined_text),
-                "was_truncated": len(combined_text) < original_length,
-            }
+            id=point_id,
+            vector=point_vector,
+            payload=payload
         )
         filtered_points.append(point)
-        id += 1
     return filtered_points
 
-def upsert(client, points, collection_name): 
-    batch_size = 25  # Smaller batches
-    successful_uploads = 0
-    failed_batches = []
 
-    print(f"\nUploading {len(points)} points in batches of {batch_size}...")
+def fetch_indexed_hashes(client, collection_name, page_size=10000): 
+    """Map point id -> content_hash for everything already in the collection."""
+    indexed = {}
+    offset = None
+    while True:
+        records, offset = client.scroll(
+            collection_name=collection_name,
+            limit=page_size,
+            offset=offset,
+            with_payload=["content_hash"],
+            with_vectors=False
+        )
+        for record in records:
+            indexed[str(record.id)] = (record.payload or {}).get("content_hash")
+        if offset is None:
+            return indexed
+
 
-    for i in tqdm(range(0, len(points), batch_size)):
-        try:
-            batch = points[i:i + batch_size]
+def iter_point_batches(csv_path, embedding_model, chunksize=50000, max_length=4000, embed_batch_size=256, embed_parallel=None, indexed_hashes=None, seen_ids=None, sparse_model=None, store_text=True, chunk_tokens=None, chunk_overlap=32, post_store=None, dedup=None, model_handle="jinaai/jina-embeddings-v2-small-en"): 
+    """
+    Read the csv in chunks, embed each chunk and yield its points, so memory stays flat.
 
-            client.upsert(
-                collection_name=collection_name,
-                points=batch
-            )
+    With indexed_hashes (incremental mode) rows whose id and content_hash are already in
+    the collection are skipped before embedding. Every id read from the csv is added to
+    seen_ids so the caller can delete the ones that vanished.
 
-            successful_uploads += len(batch)
+    With chunk_tokens set, texts are not truncated but split into overlapping passages,
+    counted in tokens of the embedding model (model_handle) so they fit its window.
 
-            # Small delay to prevent overwhelming
-            time.sleep(0.2)
+    With a post_store (normalized layout) post title/text live in the post store, comment
+    points reference them by post_id and their vector mixes in the post vector.
 
-        except Exception as e:
-            print(f"\n❌ Error uploading batch {i//batch_size + 1}: {e}")
-            failed_batches.append(i//batch_size + 1)
+    With dedup (a NearDuplicateFilter) near-duplicate comments are dropped before anything
+    else sees them, so they are neither embedded nor counted as seen (refresh deletes them).
+    """
+    total_points = 0
+    unchanged = 0
+    skipped_empty = 0
+    truncated_count = 0
+    embed_seconds = 0.0
+    # not context_packer.get_tokenizer(): CONTEXT_TOKENIZER may name the LLM's tokenizer
+    tokenizer = load_tokenizer(model_handle) if chunk_tokens else None
+
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        chunk = data_preprocessing(chunk)
+        prepared, skipped = prepare_chunk(chunk, max_length=None if chunk_tokens else max_length, normalize_posts=post_store is not None)
+        skipped_empty += skipped
+        if dedup is not None:
+            prepared = prepared[dedup.keep_mask(prepared["post_comment"])].reset_index(drop=True)
+        truncated_count += int(prepared["was_truncated"].sum())
+        if chunk_tokens:
+            prepared = chunk_passages(prepared, chunk_tokens=chunk_tokens, overlap=chunk_overlap, tokenizer=tokenizer)
+        if seen_ids is not None:
+            seen_ids.update(prepared["point_id"])
+        if post_store is not None:
+            post_store.seen.update(prepared["post_id"])
+
+        if indexed_hashes:
+            is_unchanged = prepared["point_id"].map(indexed_hashes) == prepared["content_hash"]
+            unchanged += int(is_unchanged.sum())
+            prepared = prepared[~is_unchanged].reset_index(drop=True)
+        if prepared.empty:
             continue
 
+        vectors, elapsed = embed_texts(embedding_model, prepared["text"].tolist(), batch_size=embed_batch_size, parallel=embed_parallel)
+        embed_seconds += elapsed
+        print(f"Embedded {len(prepared)} docs in {elapsed:.1f}s ({len(prepared) / elapsed:.1f} docs/sec)")
+        if post_store is not None:
+            embed_posts = lambda texts: embed_texts(embedding_model, texts, batch_size=embed_batch_size, parallel=embed_parallel)[0]
+            vectors = mix_post_vectors(prepared, vectors, post_store, embed_posts, max_length=max_length)
+            prepared = prepared.drop(columns=post_fields)
+
+        sparse_vectors = None
+        if sparse_model is not None:
+            sparse_vectors, sparse_elapsed = embed_sparse(sparse_model, prepared["text"].tolist(), batch_size=embed_batch_size, parallel=embed_parallel)
+            print(f"BM25 encoded {len(prepared)} docs in {sparse_elapsed:.1f}s")
+
+        points = create_points(prepared, vectors, sparse_vectors, store_text=store_text)
+        total_points += len(points)
+        yield points
+
+    print(f"Prepared {total_points} points (unchanged: {unchanged}, skipped empty: {skipped_empty}, truncated: {truncated_count})")
+    if dedup is not None:
+        print(f"Near-duplicate comments removed: {dedup.removed} (Jaccard >= {dedup.threshold})")
+    if post_store is not None:
+        print(f"Posts embedded once: {post_store.stats['embedded']}, reused for further comments: {post_store.stats['reused']}")
+    if embed_seconds > 0:
+        print(f"Embedding throughput: {total_points / embed_seconds:.1f} docs/sec (batch_size={embed_batch_size}, parallel={embed_parallel})")
+
+
+def delete_points(client, collection_name, point_ids, batch_size=1000): 
+    point_ids = list(point_ids)
+    for i in range(0, len(point_ids), batch_size):
+        client.delete(
+            collection_name=collection_name,
+            points_selector=models.PointIdsList(points=point_ids[i:i + batch_size])
+        )
+    return len(point_ids)
+
+
+def upsert(client, point_batches, collection_name, workers=4, max_in_flight=8, manifest_path="failed_batches.jsonl"): 
+    print(f"\nUploading points with {workers} workers (adaptive batch size)...")
+
+    stats = parallel_upsert(
+        client, point_batches, collection_name,
+        workers=workers,
+        max_in_flight=max_in_flight,
+        manifest_path=manifest_path
+    )
+
     print(f"\n✅ Upload complete!")
-    print(f"Successful uploads: {successful_uploads}")
-    print(f"Failed batches: {len(failed_batches)}")
+    print(f"Successful uploads: {stats['successful_uploads']}")
+    print(f"Failed batches: {stats['failed_batches']}")
+    if stats['failed_batches']:
+        print(f"Failed batches written to {manifest_path}, replay with --replay_manifest {manifest_path}")
     return None 
 
 
 # Verify final count
-def setup_VD(client, df,collection_name="reddit_post_comment", dim=512, model_handle="jinaai/jina-embeddings-v2-small-en"): 
-    df = data_preprocessing(df)
-    create_collection(client, collection_name,dim)
-    points = create_points(df, model_handle)
-    upsert(client, points, collection_name)
+def setup_VD(client, csv_path, collection_name="reddit_post_comment", dim=512, model_handle="jinaai/jina-embeddings-v2-small-en", chunksize=50000, embed_batch_size=256, embed_parallel=None, upload_workers=4, max_in_flight=8, manifest_path="failed_batches.jsonl", sparse_model_handle="Qdrant/bm25", store_text=True, chunk_tokens=None, chunk_overlap=32, dedup_threshold=None, quantization=None, on_disk=False, hnsw_m=None, hnsw_ef_construct=None, normalize_posts=False): 
+    start = time.perf_counter()
+    create_collection(client, collection_name,dim, quantization=quantization, on_disk=on_disk, hnsw_m=hnsw_m, hnsw_ef_construct=hnsw_ef_construct)
+    post_store = None
+    if normalize_posts:
+        post_store = PostStore(client, collection_name, manifest_path=manifest_path)
+        post_store.create(dim, on_disk=on_disk)
+    elif client.collection_exists(post_store_name(collection_name)):
+        # refresh_VD takes a post store as the sign of the normalized layout, a stale one from an
+        # earlier --normalize_posts build would turn this plain collection into a normalized one
+        client.delete_collection(post_store_name(collection_name))
+        print(f"Dropped stale post store '{post_store_name(collection_name)}'")
+    SemanticAnswerCache(client, collection_name).invalidate()
+    embedding_model = load_embedding_model(model_handle)
+    sparse_model = load_sparse_model(sparse_model_handle) if sparse_model_handle else None
+    dedup = NearDuplicateFilter(threshold=dedup_threshold) if dedup_threshold else None
+    point_batches = iter_point_batches(csv_path, embedding_model, chunksize=chunksize, embed_batch_size=embed_batch_size, embed_parallel=embed_parallel, sparse_model=sparse_model, store_text=store_text, chunk_tokens=chunk_tokens, chunk_overlap=chunk_overlap, post_store=post_store, dedup=dedup, model_handle=model_handle)
+    upsert(client, point_batches, collection_name, workers=upload_workers, max_in_flight=max_in_flight, manifest_path=manifest_path)
     collection_info = client.get_collection(collection_name)
     print(f"Collection now has {collection_info.points_count} points")
+    if post_store is not None:
+        print(f"Post store '{post_store.name}' has {client.count(post_store.name).count} posts")
+    print(f"Setup took {time.perf_counter() - start:.1f}s")
     return None 
 
 
+def refresh_VD(client, csv_path, collection_name="reddit_post_comment", model_handle="jinaai/jina-embeddings-v2-small-en", chunksize=50000, embed_batch_size=256, embed_parallel=None, upload_workers=4, max_in_flight=8, manifest_path="failed_batches.jsonl", sparse_model_handle="Qdrant/bm25", store_text=True, chunk_tokens=None, chunk_overlap=32, dedup_threshold=None): 
+    """Only embed/upsert new or changed rows and delete the points whose rows are gone from the csv."""
+    # collections built before the payload indexes existed get them here, this is a no-op otherwise
+    create_payload_indexes(client, collection_name)
+    indexed_hashes = fetch_indexed_hashes(client, collection_name)
+    print(f"Collection '{collection_name}' has {len(indexed_hashes)} indexed points")
+
+    # collections built with --normalize_posts have a post store next to them
+    post_store = None
+    if client.collection_exists(post_store_name(collection_name)):
+        post_store = PostStore(client, collection_name, manifest_path=manifest_path)
+        post_store.indexed = fetch_indexed_hashes(client, post_store.name)
+        print(f"Post store '{post_store.name}' has {len(post_store.indexed)} posts")
+
+    seen_ids = set()
+    embedding_model = load_embedding_model(model_handle)
+    sparse_model = load_sparse_model(sparse_model_handle) if sparse_model_handle else None
+    dedup = NearDuplicateFilter(threshold=dedup_threshold) if dedup_threshold else None
+    point_batches = iter_point_batches(csv_path, embedding_model, chunksize=chunksize, embed_batch_size=embed_batch_size, embed_parallel=embed_parallel, indexed_hashes=indexed_hashes, seen_ids=seen_ids, sparse_model=sparse_model, store_text=store_text, chunk_tokens=chunk_tokens, chunk_overlap=chunk_overlap, post_store=post_store, dedup=dedup, model_handle=model_handle)
+    upsert(client, point_batches, collection_name, workers=upload_workers, max_in_flight=max_in_flight, manifest_path=manifest_path)
+
+    deleted = delete_points(client, collection_name, indexed_hashes.keys() - seen_ids)
+    print(f"Deleted {deleted} vanished points")
+    if post_store is not None:
+        print(f"Deleted {delete_points(client, post_store.name, post_store.vanished())} vanished posts")
+    # cached RAG answers may have been built on context that just changed
+    SemanticAnswerCache(client, collection_name).invalidate()
+    collection_info = client.get_collection(collection_name)
+    print(f"Collection now has {collection_info.points_count} points")
+    return None 
+
+
+def ingest_options(args): 
+    """Pipeline settings shared by the full build and the incremental refresh."""
+    return dict(
+        collection_name=args.collection_name,
+        model_handle=args.model_handle,
+        chunksize=args.chunksize,
+        embed_batch_size=args.embed_batch_size,
+        embed_parallel=args.embed_parallel,
+        upload_workers=args.upload_workers,
+        max_in_flight=args.max_in_flight,
+        manifest_path=args.failed_manifest,
+        sparse_model_handle=None if args.no_bm25 else args.sparse_model_handle,
+        store_text=not args.no_text_payload,
+        chunk_tokens=args.chunk_tokens,
+        chunk_overlap=args.chunk_overlap,
+        dedup_threshold=args.dedup_threshold,
+    )
+
+
 def main(args): 
     # Decide which dense encoding model to use 
     client = QdrantClient("http://localhost:6333")
-    reddit_df = pd.read_csv("/workspaces/reddit_search/data/reddit_posts_and_comments.csv")
+
+    if args.replay_manifest:
+        stats = replay_failed_batches(client, args.replay_manifest)
+        print(f"Replayed {stats['successful_uploads']} points, {stats['failed_batches']} batches still failing")
+        return None 
 
     exists = client.collection_exists(collection_name=args.collection_name)
 
-    if exists:
-        print(f"Collection '{args.collection_name}' exists.")
+    if exists and args.incremental:
+        print(f"Collection '{args.collection_name}' exists. Refreshing it incrementally")
+        refresh_VD(client, args.csv_path, **ingest_options(args))
+    elif exists:
+        print(f"Collection '{args.collection_name}' exists. Use --incremental to refresh it.")
         return None 
     else:
         print(f"Collection '{args.collection_name}' does not exist. Creating the new collection")
-        setup_VD(client, reddit_df, collection_name=args.collection_name, dim=args.dim, model_handle=args.model_handle)
+        setup_VD(
+            client, args.csv_path, dim=args.dim,
+            quantization=args.quantization, on_disk=args.on_disk,
+            hnsw_m=args.hnsw_m, hnsw_ef_construct=args.hnsw_ef_construct,
+            normalize_posts=args.normalize_posts,
+            **ingest_options(args)
+        )
 
 
 
@@ -161,6 +536,26 @@ if __name__ == "__main__":
     parser.add_argument("--collection_name", type=str, default="reddit_post_comment", help="Qdrant collection name")
     parser.add_argument("--dim", type=int, default=512, help="Embedding dimension (default=512)")
     parser.add_argument("--model_handle", type=str, default="jinaai/jina-embeddings-v2-small-en", help="embedding model")
+    parser.add_argument("--csv_path", type=str, default="/workspaces/reddit_search/data/reddit_posts_and_comments.csv", help="Reddit posts and comments csv")
+    parser.add_argument("--sparse_model_handle", type=str, default="Qdrant/bm25", help="sparse model for the bm25 vector")
+    parser.add_argument("--no_bm25", action="store_true", help="Skip filling the bm25 sparse vector (dense-only search)")
+    parser.add_argument("--no_text_payload", action="store_true", help="Don't store the combined 'text' field in the payload (it duplicates title/post/comment)")
+    parser.add_argument("--quantization", type=str, default=None, choices=["scalar", "binary"], help="int8 scalar or binary quantization (rescored with the original vectors at search time)")
+    parser.add_argument("--on_disk", action="store_true", help="Keep the original float32 vectors on disk instead of RAM")
+    parser.add_argument("--hnsw_m", type=int, default=None, help="HNSW edges per node (qdrant default 16)")
+    parser.add_argument("--hnsw_ef_construct", type=int, default=None, help="HNSW build-time candidate list (qdrant default 100)")
+    parser.add_argument("--normalize_posts", action="store_true", help="Embed and store each post once in <collection>_posts, comment points only reference it (refresh detects this layout)")
+    parser.add_argument("--chunk_tokens", type=int, default=None, help="Split long texts into passages of this many tokens instead of truncating at 4000 chars")
+    parser.add_argument("--chunk_overlap", type=int, default=32, help="Tokens shared by consecutive passages")
+    parser.add_argument("--dedup_threshold", type=float, default=None, help="Drop comments whose MinHash Jaccard similarity to an earlier comment is at least this (e.g. 0.9)")
+    parser.add_argument("--chunksize", type=int, default=50000, help="Rows read from the csv per chunk")
+    parser.add_argument("--embed_batch_size", type=int, default=256, help="Texts per embedding batch")
+    parser.add_argument("--embed_parallel", type=int, default=None, help="Embedding worker processes (0 = all cores, default: single process)")
+    parser.add_argument("--upload_workers", type=int, default=4, help="Concurrent upsert threads")
+    parser.add_argument("--max_in_flight", type=int, default=8, help="Pending upsert batches before the reader blocks")
+    parser.add_argument("--failed_manifest", type=str, default="failed_batches.jsonl", help="Where failed batches are recorded")
+    parser.add_argument("--incremental", action="store_true", help="Only index new/changed rows of an existing collection and delete vanished ones")
+    parser.add_argument("--replay_manifest", type=str, default=None, help="Re-send the batches recorded in this manifest and exit")
     args = parser.parse_args()
     main(args) 
     
@@ -0,0 +1,130 @@
+from qdrant_client import models
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from tqdm import tqdm
+import threading
+import json
+import time
+
+
+class AdaptiveBatchSizer:
+    """Grows the upsert batch while qdrant answers quickly and shrinks it when latency goes above target."""
+
+    def __init__(self, initial=256, min_size=32, max_size=2048, target_latency=1.0):
+        self.size = initial
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_latency = target_latency
+        self.lock = threading.Lock()
+
+    def observe(self, latency):
+        with self.lock:
+            if latency < self.target_latency / 2:
+                self.size = min(self.size * 2, self.max_size)
+            elif latency > self.target_latency:
+                self.size = max(self.size // 2, self.min_size)
+
+    def current(self):
+        with self.lock:
+            return self.size
+
+
+def upsert_with_retry(client, collection_name, batch, max_retries=5, base_delay=0.5):
+    """Upsert one batch, retrying with exponential backoff. Returns the last error or None."""
+    last_error = None
+    for attempt in range(max_retries):
+        try:
+            client.upsert(collection_name=collection_name, points=batch, wait=True)
+            return None
+        except Exception as e:
+            last_error = e
+            if attempt < max_retries - 1:
+                time.sleep(base_delay * (2 ** attempt))
+    return last_error
+
+
+def write_failed_batch(manifest_path, collection_name, batch_no, batch, error):
+    """Append a failed batch to the jsonl manifest so it can be replayed later."""
+    record = {
+        "collection_name": collection_name,
+        "batch_no": batch_no,
+        "error": str(error),
+        "points": [point.model_dump(exclude_none=True) for point in batch],
+    }
+    with open(manifest_path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def read_failed_batches(manifest_path):
+    """Yield (collection_name, points) for every batch recorded in the manifest."""
+    with open(manifest_path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            points = [models.PointStruct(**point) for point in record["points"]]
+            yield record["collection_name"], points
+
+
+def split_batches(point_batches, sizer):
+    """Re-slice the incoming point lists into upsert batches using the current adaptive size."""
+    for points in point_batches:
+        i = 0
+        while i < len(points):
+            size = sizer.current()
+            yield points[i:i + size]
+            i += size
+
+
+def parallel_upsert(client, point_batches, collection_name, workers=4, max_in_flight=8,
+                    initial_batch_size=256, target_latency=1.0, max_retries=5,
+                    manifest_path="failed_batches.jsonl"):
+    """
+    Upload point batches from a bounded thread pool.
+
+    The producer (reading and embedding the next csv chunk) keeps running while earlier
+    batches are in flight; once max_in_flight batches are pending it blocks until one
+    finishes, which is the backpressure that replaces the old fixed sleep.
+    """
+    sizer = AdaptiveBatchSizer(initial=initial_batch_size, target_latency=target_latency)
+    stats = {"successful_uploads": 0, "failed_batches": 0}
+    stats_lock = threading.Lock()
+    progress = tqdm(unit="points")
+
+    def upload(batch_no, batch):
+        start = time.perf_counter()
+        error = upsert_with_retry(client, collection_name, batch, max_retries=max_retries)
+        sizer.observe(time.perf_counter() - start)
+        with stats_lock:
+            if error is None:
+                stats["successful_uploads"] += len(batch)
+                progress.update(len(batch))
+            else:
+                stats["failed_batches"] += 1
+                print(f"\n❌ Error uploading batch {batch_no} after {max_retries} attempts: {error}")
+                write_failed_batch(manifest_path, collection_name, batch_no, batch, error)
+
+    in_flight = set()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for batch_no, batch in enumerate(split_batches(point_batches, sizer), start=1):
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            in_flight.add(executor.submit(upload, batch_no, batch))
+        for future in wait(in_flight).done:
+            future.result()
+    progress.close()
+    return stats
+
+
+def replay_failed_batches(client, manifest_path, max_retries=5):
+    """Re-send every batch from a manifest. Batches that fail again go to <manifest>.retry."""
+    stats = {"successful_uploads": 0, "failed_batches": 0}
+    for batch_no, (collection_name, batch) in enumerate(read_failed_batches(manifest_path), start=1):
+        error = upsert_with_retry(client, collection_name, batch, max_retries=max_retries)
+        if error is None:
+            stats["successful_uploads"] += len(batch)
+        else:
+            stats["failed_batches"] += 1
+            write_failed_batch(manifest_path + ".retry", collection_name, batch_no, batch, error)
+    return stats